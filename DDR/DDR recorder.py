@@ -2,11 +2,44 @@ import tkinter as tk
 import pandas as pd
 import time
 import json
+import struct
 import numpy as np
+from DDRlike import save_chart
+
+# Every note written to the chart while recording is an event: the division it lands on, its lane and its value,
+# 1 a tap, 2 the start of a hold and 3 its end. A later event on the same division and lane replaces an earlier one.
+eventType = np.dtype([('division', '<i4'), ('lane', 'u1'), ('value', 'u1')])
+# header of the events file: magic, bpm, divisions per beat, then the events as eventType records
+eventsHeader = struct.Struct('<4sdI')
+
+
+def load_events(filename):
+    # Reads an events file back, also one left by a recording that never reached process_save
+    with open(filename, 'rb') as events_file:
+        magic, bpm, divisionsPerBeat = eventsHeader.unpack(events_file.read(eventsHeader.size))
+        if magic != b'DDRE':
+            raise ValueError(filename + ' is not a DDR events file')
+        return bpm, divisionsPerBeat, np.fromfile(events_file, dtype=eventType)
+
+
+def build_chart(events):
+    # The chart as process_save has always written it: only divisions with a note, numbered from the first of them,
+    # a column of values for each lane
+    if not len(events):
+        return pd.DataFrame(columns=range(4), dtype=float)
+    cells = events['division'].astype(np.int64) * 4 + events['lane']
+    # last event on each cell, found as the first in the reversed list
+    cells, last = np.unique(cells[::-1], return_index=True)
+    values = events['value'][::-1][last]
+    divisions, rows = np.unique(cells // 4, return_inverse=True)
+    # floats, as Song.txt has always held them
+    chart = np.zeros((len(divisions), 4))
+    chart[rows, cells % 4] = values
+    return pd.DataFrame(chart, index=divisions - divisions[0])
 
 
 class Recorder:
-    def __init__(self, bpm=100, divisionsPerBeat=4):
+    def __init__(self, bpm=100, divisionsPerBeat=4, eventsFile='Song.events', chunkSize=256, flushLines=16):
         self.bpm = bpm
         self.dpb = divisionsPerBeat
         self.linetime = 60 * 1000 / self.bpm / self.dpb
@@ -21,8 +54,17 @@ class Recorder:
         self.root.bind('<Right>', self.handlePress)
         self.root.bind('<KeyRelease>', self.handleRelease)
         self.root.bind('<Return>', self.exit)
-        self.dict = {0: np.array([0]), 1: np.array([0]), 2: np.array([0]), 3: np.array([0])}
-        self.df = None
+        # events live in a buffer that doubles when full, and are written out to eventsFile chunkSize at a time, or
+        # every flushLines divisions if fewer are waiting, so a crash loses at most the last few
+        self.events = np.zeros(chunkSize, dtype=eventType)
+        self.numEvents = 0
+        self.numWritten = 0
+        self.chunkSize = chunkSize
+        self.flushLines = flushLines
+        # division of each lane's last release, a press cannot follow it on the same division
+        self.releasedDivision = {0: -1, 1: -1, 2: -1, 3: -1}
+        self.eventsFile = open(eventsFile, 'wb')
+        self.eventsFile.write(eventsHeader.pack(b'DDRE', bpm, divisionsPerBeat))
         self.startTime = time.time()
         self.theoreticalTime = 0
         self.root.after(self.looptime, self.newline)
@@ -31,9 +73,8 @@ class Recorder:
     def newline(self):
         self.theoreticalTime += self.linetime
         self.index += 1
-        lines = self.index - len(self.dict[0])
-        for i in range(4):
-            self.dict[i] = np.append(self.dict[i], [0] * lines)
+        if self.index % self.flushLines == 0 and self.numWritten < self.numEvents:
+            self.write_events()
         overshoot = 1000 * (time.time() - self.startTime) - self.theoreticalTime
         self.root.after(int(self.looptime - overshoot), self.newline)
 
@@ -41,12 +82,12 @@ class Recorder:
         if (event.keycode < 37) | (event.keycode > 40):
             return
         code = {37: 0, 38: 2, 39: 3, 40: 1}[event.keycode]
-        if self.dict[code][-1] == 3:
+        if self.releasedDivision[code] == self.division():
             return
         if self.channelState[code]:
             self.channelState[code] = False
             self.pressedFrames[code] = self.index
-            self.dict[code][-1] = 1
+            self.add_event(self.division(), code, 1)
 
     def handleRelease(self, event):
         if (event.keycode < 37) | (event.keycode > 40):
@@ -56,26 +97,40 @@ class Recorder:
         if self.index == self.pressedFrames[code]:
             pass  # Leave as 1
         else:
-            self.dict[code][-1] = 3
-            self.dict[code][self.pressedFrames[code] - 1] = 2
+            self.add_event(self.division(), code, 3)
+            self.add_event(self.division(self.pressedFrames[code]), code, 2)
+            self.releasedDivision[code] = self.division()
+
+    def division(self, index=None):
+        # the division a key event at index lands on, the line before the one being counted
+        return max(self.index if index is None else index, 1) - 1
+
+    def add_event(self, division, lane, value):
+        if self.numEvents == len(self.events):
+            self.events = np.resize(self.events, 2 * len(self.events))
+        self.events[self.numEvents] = (division, lane, value)
+        self.numEvents += 1
+        if self.numEvents - self.numWritten >= self.chunkSize:
+            self.write_events()
+
+    def write_events(self):
+        self.events[self.numWritten:self.numEvents].tofile(self.eventsFile)
+        self.eventsFile.flush()
+        self.numWritten = self.numEvents
 
     def exit(self, event):
         self.root.destroy()
-        self.df = pd.DataFrame(self.dict)
-
-    def process_save(self, filename='Song.txt'):
-        df = self.df
-        temp = (df == 0).apply(np.all, axis=1)
-        # Drop initial rows with all zeros i.e. no notes.
-        df = df.iloc[temp[temp == False].index[0]:]
-        # Reset index so first is zero
-        df.reset_index(drop=True, inplace=True)
-        temp = (df == 0).apply(np.all, axis=1)
-        # Drop all rows with no notes, but leave the index as it.
-        df = df.loc[temp == False]
+        self.write_events()
+        self.eventsFile.close()
+        self.df = build_chart(self.events[:self.numEvents])
+
+    def process_save(self, filename='Song.txt', chartname='Song.chart'):
         with open(filename, 'w') as json_file:
-            json.dump(df.to_dict(), json_file)
+            json.dump(self.df.to_dict(), json_file)
+        # DDRlike.py plays the chart when there is one
+        save_chart(chartname, self.df, self.bpm, self.dpb)
 
 
-a = Recorder(bpm=100, divisionsPerBeat=4)
-a.process_save()
+if __name__ == '__main__':
+    a = Recorder(bpm=100, divisionsPerBeat=4)
+    a.process_save()
@@ -3,6 +3,55 @@ import numpy as np
 import time
 import pandas as pd
 import json
+import struct
+
+# A chart file holds its notes as columns: the division each lands on, the hold length in divisions of a hold start,
+# its lane, and its type, 1 a tap, 2 the start of a hold and 3 its end. The header is magic, version, bpm, divisions
+# per beat and the number of notes, 24 bytes so every column starts aligned.
+chartHeader = struct.Struct('<4sIdII')
+chartColumns = [('division', '<i4'), ('hold', '<i4'), ('lane', 'u1'), ('note', 'u1')]
+
+
+def save_chart(filename, transcript, bpm=100, divisions_per_beat=4):
+    # transcript is a DataFrame as the recorder saves it, a column for each lane and a row for each division
+    values = transcript.fillna(0).to_numpy(dtype=np.int64)
+    rows, lanes = np.nonzero(values)
+    division = transcript.index.to_numpy(dtype=np.int64)[rows]
+    note = values[rows, lanes]
+    # a hold lasts until the next end in its lane, found by searching the ends ordered by lane then division
+    ends = np.sort(lanes[note == 3] * 2 ** 32 + division[note == 3])
+    starts = lanes * 2 ** 32 + division
+    found = np.minimum(np.searchsorted(ends, starts), max(len(ends) - 1, 0))
+    hold = np.zeros(len(note), dtype=np.int64)
+    if len(ends):
+        matched = (note == 2) & (ends[found] // 2 ** 32 == lanes)
+        hold[matched] = ends[found][matched] - starts[matched]
+    with open(filename, 'wb') as chart_file:
+        chart_file.write(chartHeader.pack(b'DDRC', 1, bpm, divisions_per_beat, len(note)))
+        for (name, dtype), column in zip(chartColumns, (division, hold, lanes, note)):
+            column.astype(dtype).tofile(chart_file)
+
+
+def load_chart(filename):
+    # maps the file and views the columns in place, nothing is parsed or copied
+    buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+    magic, version, bpm, divisions, numNotes = chartHeader.unpack_from(buffer)
+    if magic != b'DDRC':
+        raise ValueError(filename + ' is not a DDR chart')
+    chart = {'bpm': bpm, 'divisions': divisions}
+    offset = chartHeader.size
+    for name, dtype in chartColumns:
+        chart[name] = np.frombuffer(buffer, dtype=dtype, count=numNotes, offset=offset)
+        offset += numNotes * np.dtype(dtype).itemsize
+    return chart
+
+
+def chart_transcript(chart):
+    # the DataFrame DdrFile plays from, a row for each division with a note
+    divisions, rows = np.unique(chart['division'], return_inverse=True)
+    values = np.zeros((len(divisions), 4))
+    values[rows, chart['lane']] = chart['note']
+    return pd.DataFrame(values, index=divisions)
 
 
 class DdrFile:
@@ -16,6 +65,11 @@ class DdrFile:
         self.divisions = divisions_per_beat
         self.beatsBeforeNote = beats_before_note
 
+    @classmethod
+    def from_chart(cls, filename, beats_before_note=2):
+        chart = load_chart(filename)
+        return cls(chart_transcript(chart), chart['bpm'], chart['divisions'], beats_before_note)
+
     def get_note_lifetime_div(self):
         return self.divisions * self.beatsBeforeNote
 
@@ -424,8 +478,14 @@ class HeldNote(Note):
             return
         self.widget.after(self.framelength, self.on_release_animation)
 
-df = pd.DataFrame(json.load(open("Song.txt")))
-df.index = df.index.astype(int)
-df.columns = df.columns.astype(int)
-play = DdrFile(df, bpm=100, divisions_per_beat=4)
-DDR(play, framerate=60)
\ No newline at end of file
+
+if __name__ == '__main__':
+    # a chart written by convert_chart.py is used over the JSON one
+    try:
+        play = DdrFile.from_chart('Song.chart')
+    except FileNotFoundError:
+        df = pd.DataFrame(json.load(open("Song.txt")))
+        df.index = df.index.astype(int)
+        df.columns = df.columns.astype(int)
+        play = DdrFile(df, bpm=100, divisions_per_beat=4)
+    DDR(play, framerate=60)
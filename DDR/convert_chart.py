@@ -0,0 +1,44 @@
+import argparse
+import json
+import os
+import pandas as pd
+from DDRlike import save_chart, load_chart, chart_transcript
+
+# Migrates charts saved as DataFrame JSON, the recorder's Song.txt, to the binary chart format DDRlike.py plays from
+# Song.chart. The notes are read back from the new file and checked against the JSON before moving on.
+# Run from this folder: python convert_chart.py Song.txt
+
+
+def read_json_chart(filename):
+    df = pd.DataFrame(json.load(open(filename)))
+    df.index = df.index.astype(int)
+    df.columns = df.columns.astype(int)
+    return df
+
+
+def convert(source, target, bpm=100, divisions_per_beat=4):
+    transcript = read_json_chart(source)
+    save_chart(target, transcript, bpm, divisions_per_beat)
+    # rows without notes are not kept, the rest must come back unchanged
+    transcript = transcript.fillna(0)
+    transcript = transcript.loc[(transcript != 0).any(axis=1)]
+    converted = chart_transcript(load_chart(target))
+    return converted.equals(transcript.astype(float).sort_index()), len(transcript)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert JSON charts to the binary chart format')
+    parser.add_argument('charts', nargs='+', help='JSON charts, e.g. Song.txt')
+    parser.add_argument('-o', '--output', default=None, help='target for a single chart, default Song.chart for '
+                                                               'Song.txt and the same name with .chart otherwise')
+    parser.add_argument('--bpm', type=float, default=100, help='bpm the chart was recorded at')
+    parser.add_argument('--divisions', type=int, default=4, help='divisions per beat the chart was recorded at')
+    args = parser.parse_args()
+    if args.output is not None and len(args.charts) > 1:
+        parser.error('-o takes a single chart')
+    for source in args.charts:
+        target = args.output or os.path.splitext(source)[0] + '.chart'
+        matches, rows = convert(source, target, args.bpm, args.divisions)
+        print('{} -> {}: {} divisions with notes, {} to {} bytes, {}'.format(
+            source, target, rows, os.path.getsize(source), os.path.getsize(target),
+            'checked' if matches else 'MISMATCH'))
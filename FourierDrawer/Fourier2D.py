@@ -1,4 +1,8 @@
+import glob
+import hashlib
 import math
+import os
+import time
 import numpy as np
 import tkinter as tk
 import turtle
@@ -6,30 +10,263 @@ import turtle
 
 def get_lagrange(x, y):
     # Returns the coefficients of a degree len(x)-1 polynomial that interpolates the given points
-    def take_sums(x, at_a_time):
-        if at_a_time == 0:
-            return 1
-        else:
-            return sum([x[ind] * take_sums(x[ind + 1:], at_a_time - 1) for ind in range(len(x) - at_a_time + 1)])
-
-    # force np arrays
-    x = np.array(x)
-    y = np.array(y)
+    # Newton divided differences are built in place, then the nested Newton form is expanded into
+    # power basis coefficients, 0th order first. Both passes are O(n^2).
+    x = np.array(x).astype(np.float64)
+    divided = np.array(y).astype(np.result_type(np.array(y), np.float64))
     n = len(x)
-    order = n - 1
-    coeffs = np.array([0] * n).astype(np.float64)
-    # for each polynomial
-    for i in range(n):
-        minusx = np.delete(np.copy(x), i) * -1
-        # 0th order first
-        sums = np.array([1] * n)
-        for m in range(order):
-            # calculate sums taken m+1 at a time
-            sums[-2 - m] = take_sums(minusx, m + 1)
-        coeffs += y[i] * sums / np.prod([x[i] + minusx[j] for j in range(order)])
+    for j in range(1, n):
+        divided[j:] = (divided[j:] - divided[j - 1:-1]) / (x[j:] - x[:-j])
+    coeffs = np.zeros(n).astype(divided.dtype)
+    coeffs[0] = divided[-1]
+    # p(t) <- p(t) * (t - x_k) + divided_k, from the innermost bracket out
+    for k in range(n - 2, -1, -1):
+        coeffs[1:] = coeffs[:-1] - x[k] * coeffs[1:]
+        coeffs[0] = divided[k] - x[k] * coeffs[0]
     return coeffs
 
 
+def pad_polys(polys):
+    # Stacks coefficient lists of any degree into one zero padded matrix, a row per polynomial
+    padded = np.zeros((len(polys), max(len(poly) for poly in polys))).astype(np.result_type(*polys, np.float64))
+    for i, poly in enumerate(polys):
+        padded[i, :len(poly)] = poly
+    return padded
+
+
+def segment_integrals(polys, starts, durations, T, orders):
+    # Integrates every segment polynomial p_s(tau), tau in [0, durations[s]], against exp(-2 pi i k t / T) with
+    # t = starts[s] + tau, for all orders k in one batch. Returns shape (len(polys), len(orders)).
+    # Repeated integration by parts, with b = -2 pi i k / T:
+    #   int p(tau) exp(b tau) dtau = exp(b tau) * sum_j (-1)^j p^(j)(tau) / b^(j+1)
+    coeffs = pad_polys(polys).astype(complex)
+    starts = np.array(starts).astype(np.float64)
+    durations = np.array(durations).astype(np.float64)
+    orders = np.array(orders)
+    numTerms = coeffs.shape[1]
+    durationPowers = durations[:, None] ** np.arange(numTerms)
+    # p^(j)(0) and p^(j)(duration) for j = 0..degree
+    atStart = np.zeros(coeffs.shape).astype(complex)
+    atEnd = np.zeros(coeffs.shape).astype(complex)
+    derivative = coeffs
+    for j in range(numTerms):
+        atStart[:, j] = derivative[:, 0]
+        atEnd[:, j] = np.sum(derivative * durationPowers[:, :numTerms - j], axis=1)
+        derivative = derivative[:, 1:] * np.arange(1, numTerms - j)
+
+    integrals = np.zeros((len(coeffs), len(orders))).astype(complex)
+    nonzero = orders != 0
+    # 1/b = i * a with a = T / (2 pi k), weights are (-1)^j (i a)^(j+1)
+    ia = 1j * T / (2 * np.pi * orders[nonzero])
+    weights = (-ia[:, None]) ** np.arange(numTerms) * ia[:, None]
+    phaseStart = np.exp(-2j * np.pi * np.outer(starts, orders[nonzero]) / T)
+    phaseEnd = np.exp(-2j * np.pi * np.outer(starts + durations, orders[nonzero]) / T)
+    integrals[:, nonzero] = phaseEnd * (atEnd @ weights.T) - phaseStart * (atStart @ weights.T)
+    # order 0 has no exponential to integrate by parts against, integrate the polynomial directly
+    integrals[:, ~nonzero] = np.sum(coeffs * durationPowers * durations[:, None] / np.arange(1, numTerms + 1),
+                                    axis=1, keepdims=True)
+    return integrals
+
+
+def curve_energy(polys, durations):
+    # Sum over segments of int_0^duration |p(tau)|^2 dtau, from the coefficients:
+    #   int |p|^2 = sum_mn p_m conj(p_n) duration^(m+n+1) / (m+n+1)
+    coeffs = pad_polys(polys).astype(complex)
+    durations = np.array(durations).astype(np.float64)
+    powers = np.add.outer(np.arange(coeffs.shape[1]), np.arange(coeffs.shape[1])) + 1
+    weights = durations[:, None, None] ** powers / powers
+    return np.real(np.einsum('sm,smn,sn->', coeffs, weights, np.conj(coeffs)))
+
+
+def sample_polys(coeffs, t):
+    # Horner's scheme for every row of a padded coefficient matrix (0th order first) over one shared t,
+    # returns shape (len(coeffs),) + t.shape
+    coeffs = np.asarray(coeffs)
+    t = np.asarray(t)
+    result = np.zeros((coeffs.shape[0],) + t.shape).astype(np.result_type(coeffs, t, np.float64))
+    for n in range(coeffs.shape[1] - 1, -1, -1):
+        result *= t
+        result += coeffs[:, n].reshape((-1,) + (1,) * t.ndim)
+    return result
+
+
+def sample_rows(coeffs, t):
+    # Horner's scheme where row i of the padded coefficient matrix is evaluated only at t[i]
+    coeffs = np.asarray(coeffs)
+    result = np.zeros(len(coeffs)).astype(np.result_type(coeffs, t, np.float64))
+    for n in range(coeffs.shape[1] - 1, -1, -1):
+        result = result * t + coeffs[:, n]
+    return result
+
+
+def diff_polys(coeffs):
+    # Derivative of every row of a padded coefficient matrix
+    coeffs = np.asarray(coeffs)
+    return coeffs[:, 1:] * np.arange(1, coeffs.shape[1])
+
+
+def solve_tridiagonal(lower, diag, upper, rhs):
+    # Thomas algorithm, O(n). lower[i] multiplies x[i-1] and upper[i] multiplies x[i+1] in row i, so lower[0]
+    # and upper[-1] are unused.
+    # the sweeps run on python scalars, indexing numpy arrays element by element is several times slower
+    lower, diag, upper, rhs = (np.asarray(v).tolist() for v in (lower, diag, upper, rhs))
+    n = len(diag)
+    c = [0] * n
+    d = [0] * n
+    c[0] = upper[0] / diag[0]
+    d[0] = rhs[0] / diag[0]
+    for i in range(1, n):
+        denom = diag[i] - lower[i] * c[i - 1]
+        c[i] = upper[i] / denom if i < n - 1 else 0
+        d[i] = (rhs[i] - lower[i] * d[i - 1]) / denom
+    for i in range(n - 2, -1, -1):
+        d[i] -= c[i] * d[i + 1]
+    return np.array(d)
+
+
+def length_derivatives(lines):
+    # dz/df of each segment's dzP3 with the parameter rescaled to f = t / duration in [0, 1], padded
+    durations = np.concatenate([line.get_time() for line in lines]).astype(np.float64)
+    # a zero row keeps at least one column when every segment is a single point
+    dz = pad_polys([line.dzP3.get_coeffs() for line in lines] + [np.zeros(1)])[:-1]
+    return dz * durations[:, None] ** np.arange(1, dz.shape[1] + 1)
+
+
+def arc_length_tables(lines, numIntervals=128):
+    # Each segment's arc length from its start at numIntervals + 1 evenly spaced parameter values, integrated from
+    # the derivative polynomial dzP3 with 5 point Gauss-Legendre on every interval. Tables are built once per
+    # segment and kept on it as line.arcTable; the missing ones are all evaluated in one pass.
+    missing = [line for line in lines if line.arcTable is None]
+    if missing:
+        nodes, weights = np.polynomial.legendre.leggauss(5)
+        f = (np.arange(numIntervals)[:, None] + (nodes + 1) / 2) / numIntervals
+        speeds = np.abs(sample_polys(length_derivatives(missing), f))
+        intervals = np.sum(speeds * weights / 2, axis=2) / numIntervals
+        tables = np.concatenate([np.zeros((len(missing), 1)), np.cumsum(intervals, axis=1)], axis=1)
+        for line, table in zip(missing, tables):
+            line.arcTable = table
+    return np.array([line.arcTable for line in lines])
+
+
+def times_by_length(lines, spacing):
+    # Parameter values along a chain of segments at even arc length steps of spacing or just under, both ends included.
+    # Steps are exact up to the tables' accuracy, near a cusp they can come out a little long, a few percent of
+    # the finest spacings (benchmarks.py arclength reports the widest gap).
+    # Returns the segment index and the time within that segment of each sample.
+    tables = arc_length_tables(lines)
+    starts = np.concatenate([[0], np.cumsum(tables[:, -1])[:-1]])
+    total = starts[-1] + tables[-1, -1]
+    numSamples = max(2, int(np.ceil(total / spacing)) + 1)
+    # the tables laid end to end are one nondecreasing table of arc length against segment index + fraction
+    fractions = np.linspace(0, 1, tables.shape[1])
+    lengths = np.linspace(0, total, numSamples)
+    position = np.interp(lengths, (tables + starts[:, None]).ravel(),
+                         (np.arange(len(lines))[:, None] + fractions).ravel())
+    index = np.minimum(position.astype(int), len(lines) - 1)
+    f = position - index
+    # the table is linear between its entries, one Newton step on the exact length from the entry below pulls
+    # each sample onto its target
+    dz = length_derivatives(lines)[index]
+    numIntervals = tables.shape[1] - 1
+    below = np.minimum(np.floor(f * numIntervals).astype(int), numIntervals - 1)
+    nodes, weights = np.polynomial.legendre.leggauss(5)
+    width = f - below / numIntervals
+    partial = sum(weight / 2 * width * np.abs(sample_rows(dz, below / numIntervals + width * (node + 1) / 2))
+                  for node, weight in zip(nodes, weights))
+    speed = np.abs(sample_rows(dz, f))
+    error = tables[index, below] + partial - (lengths - starts[index])
+    step = f - np.divide(error, speed, out=np.zeros(len(f)), where=speed > 0)
+    # the target lies between the entries around f, a step leaving them (near a cusp, where speed is small) is
+    # dropped and the table's value kept
+    inside = (step >= below / numIntervals) & (step <= (below + 1) / numIntervals)
+    f = np.where(inside, step, f)
+    durations = np.concatenate([line.get_time() for line in lines]).astype(np.float64)
+    return index, f * durations[index]
+
+
+def sample_by_length(lines, spacing):
+    # Points on a chain of segments spaced evenly by arc length, as complex x + iy
+    index, t = times_by_length(lines, spacing)
+    return sample_rows(pad_polys([line.get_Cpoly() for line in lines])[index], t)
+
+
+def interpolate_shapes(shapes, numSamples=50, fit='curve', spacing=None):
+    # Fits x and y of every GraphicalShape and samples them all in one Horner pass. Each shape is parameterized
+    # by point index, t = 0..len-1, so coefficients are rescaled to a shared grid u = t / (len-1) in [0, 1].
+    # With a spacing the samples are instead spread evenly along each shape's length, about spacing apart.
+    if len(shapes) == 0:
+        return
+    if spacing is not None:
+        fitted = [{'curve': Curve, 'spline': Spline}[fit](np.rollaxis(shape.points, 1)).get_pieces()
+                  for shape in shapes]
+        # tables for every shape in one batch
+        arc_length_tables([line for lines in fitted for line in lines])
+        for shape, lines in zip(shapes, fitted):
+            z = sample_by_length(lines, spacing)
+            shape.samples = np.rollaxis(np.array([np.real(z), np.imag(z)]), 1)
+        return
+    if fit == 'spline':
+        interpolate_splines(shapes, numSamples)
+        return
+    rows = []
+    for shape in shapes:
+        t = np.arange(len(shape.points))
+        scale = float(t[-1]) ** t
+        rows.append(get_lagrange(t, shape.points[:, 0]) * scale)
+        rows.append(get_lagrange(t, shape.points[:, 1]) * scale)
+    sampled = sample_polys(pad_polys(rows), np.linspace(0, 1, numSamples))
+    for i, shape in enumerate(shapes):
+        shape.samples = np.rollaxis(sampled[2 * i:2 * i + 2], 1)
+
+
+def interpolate_splines(shapes, numSamples=50):
+    # As interpolate_shapes, but every piece of every shape's Spline is sampled over one shared grid in [0, 1]
+    splines = [Spline(np.rollaxis(shape.points, 1)) for shape in shapes]
+    perPiece = max(int(np.ceil((numSamples - 1) / len(spline.get_pieces()))) + 1 for spline in splines)
+    sampled = sample_polys([piece.get_Cpoly() for spline in splines for piece in spline.get_pieces()],
+                           np.linspace(0, 1, perPiece))
+    start = 0
+    for shape, spline in zip(shapes, splines):
+        pieces = sampled[start:start + len(spline.get_pieces())]
+        start += len(pieces)
+        # neighbouring pieces share an end point
+        z = np.append(pieces[:, :-1].ravel(), pieces[-1, -1])
+        shape.samples = np.rollaxis(np.array([np.real(z), np.imag(z)]), 1)
+
+
+def simplify_stroke(points, epsilon):
+    # Ramer-Douglas-Peucker: returns the indices of the points to keep so that no dropped point is further than
+    # epsilon from the polyline through the kept ones. Each span's distances are computed in one vectorized step.
+    points = np.asarray(points)
+    keep = np.zeros(len(points)).astype(bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        chord = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length = np.hypot(chord[0], chord[1])
+        if length > 0:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        worst = np.argmax(distances)
+        if distances[worst] > epsilon:
+            split = first + 1 + worst
+            keep[split] = True
+            spans.append((first, split))
+            spans.append((split, last))
+    return np.nonzero(keep)[0]
+
+
+def split_stroke(points, pointsPerShape=5):
+    # Cuts a point sequence into pieces of up to pointsPerShape points, neighbours sharing their end point
+    step = pointsPerShape - 1
+    return [np.array(points[i:i + pointsPerShape]) for i in range(0, max(len(points) - 1, 1), step)]
+
+
 class Poly:
     def __init__(self, coeffs):
         # coeffs with 0th order first
@@ -38,10 +275,10 @@ class Poly:
 
     def sample(self, t):
         # t should be a np array
-        return sum([self.coeffs[n] * t ** n for n in np.arange(self.degree + 1)])
+        return sample_polys([self.coeffs], t)[0]
 
     def diff(self):
-        return Poly((self.coeffs * np.arange(self.degree + 1))[1:])
+        return Poly(diff_polys([self.coeffs])[0])
 
     def get_coeffs(self):
         return self.coeffs
@@ -51,9 +288,10 @@ class StraightLine:
     def __init__(self, x1, x2, y1, y2):
         # points is a numpy array shape=(2,n), first row is x's
         self.xs = np.array([x1, x2])
-        self.ys = np.arary([y1, y2])
+        self.ys = np.array([y1, y2])
 
         self.time = 1
+        self.arcTable = None
         self.xcoeffs = get_lagrange([0, 1], self.xs)
         self.ycoeffs = get_lagrange([0, 1], self.ys)
         self.zcoeffs = self.xcoeffs + 1j * self.ycoeffs
@@ -72,6 +310,9 @@ class StraightLine:
         #                        [self.dyP3.sample(self.tpoints)]])**2).sum(axis=0)**0.5
         # self.curve_length = ((x1-x2)**2+(y1-y2)**2)**0.5
 
+    def get_pieces(self):
+        return [self]
+
     def get_Cpoly(self):
         return self.zcoeffs
 
@@ -90,6 +331,8 @@ class Curve:
         self.xs = points[0, :]
         self.ys = points[1, :]
         self.time = len(self.xs) - 1
+        # arc length lookup table, built by arc_length_tables when first needed
+        self.arcTable = None
         self.xcoeffs = get_lagrange(np.arange(len(self.xs)), self.xs)
         self.ycoeffs = get_lagrange(np.arange(len(self.ys)), self.ys)
         self.zcoeffs = self.xcoeffs + 1j * self.ycoeffs
@@ -102,6 +345,9 @@ class Curve:
         self.dyP3 = self.yP4.diff()
         self.dzP3 = self.zP4.diff()
 
+    def get_pieces(self):
+        return [self]
+
     def get_Cpoly(self):
         return self.zcoeffs
 
@@ -112,85 +358,458 @@ class Curve:
         return np.array([self.time])
 
 
+class Spline:
+    # Piecewise cubic through the points, one SplinePiece between each pair, with the same parameterization by
+    # point index as Curve. boundary is 'natural' (zero second derivative at the ends) or 'clamped', where slopes
+    # gives dz/dt at the first and last point as complex x + iy.
+    def __init__(self, points, boundary='natural', slopes=(0, 0)):
+        self.boundary = boundary
+        self.slopes = slopes
+        self.pieces = []
+        self.set_points(points)
+
+    def set_points(self, points):
+        self.xs = points[0, :]
+        self.ys = points[1, :]
+        self.time = len(self.xs) - 1
+        z = self.xs + 1j * self.ys
+        n = len(z)
+        # Slopes D at the knots with unit spacing: D[i-1] + 4 D[i] + D[i+1] = 3 (z[i+1] - z[i-1])
+        lower = np.ones(n)
+        diag = np.full(n, 4.0)
+        upper = np.ones(n)
+        rhs = np.zeros(n).astype(complex)
+        rhs[1:-1] = 3 * (z[2:] - z[:-2])
+        if self.boundary == 'clamped':
+            diag[[0, -1]] = 1
+            upper[0] = lower[-1] = 0
+            rhs[[0, -1]] = self.slopes
+        else:
+            diag[[0, -1]] = 2
+            rhs[0] = 3 * (z[1] - z[0])
+            rhs[-1] = 3 * (z[-1] - z[-2])
+        slopes = solve_tridiagonal(lower, diag, upper, rhs)
+        # cubic Hermite coefficients of each piece, 0th order first
+        dz = np.diff(z)
+        coeffs = np.array([z[:-1], slopes[:-1], 3 * dz - 2 * slopes[:-1] - slopes[1:],
+                           -2 * dz + slopes[:-1] + slopes[1:]]).T
+        derivatives = diff_polys(coeffs)
+        if len(self.pieces) == len(coeffs):
+            for piece, row, derivative in zip(self.pieces, coeffs, derivatives):
+                piece.set_coeffs(row, derivative)
+        else:
+            self.pieces = [SplinePiece(row, derivative) for row, derivative in zip(coeffs, derivatives)]
+
+    def get_pieces(self):
+        return self.pieces
+
+    def get_points(self):
+        return self.xs + 1j * self.ys
+
+    def get_time(self):
+        return np.array([self.time])
+
+
+class SplinePiece:
+    # One cubic of a Spline over t in [0, 1], usable anywhere a Curve segment is
+    def __init__(self, zcoeffs, dzcoeffs=None):
+        self.time = 1
+        self.set_coeffs(zcoeffs, dzcoeffs)
+
+    def set_coeffs(self, zcoeffs, dzcoeffs=None):
+        # dzcoeffs lets Spline pass in derivatives it computed for all pieces at once
+        if dzcoeffs is None:
+            dzcoeffs = diff_polys([zcoeffs])[0]
+        self.zcoeffs = zcoeffs
+        self.arcTable = None
+        self.xcoeffs = np.real(zcoeffs)
+        self.ycoeffs = np.imag(zcoeffs)
+        self.xP4 = Poly(self.xcoeffs)
+        self.yP4 = Poly(self.ycoeffs)
+        self.zP4 = Poly(self.zcoeffs)
+        # analytic derivative functions
+        self.dxP3 = Poly(np.real(dzcoeffs))
+        self.dyP3 = Poly(np.imag(dzcoeffs))
+        self.dzP3 = Poly(dzcoeffs)
+
+    def get_pieces(self):
+        return [self]
+
+    def get_Cpoly(self):
+        return self.zcoeffs
+
+    def get_points(self):
+        return self.zP4.sample(np.array([0, 1]))
+
+    def get_time(self):
+        return np.array([self.time])
+
+
+class CoefficientCache:
+    # On disk store of Shape.contributions, one .npy per drawing named by a hash of its segment polynomials and
+    # durations, so the same points fitted the same way always find the same file. Entries are loaded memory mapped
+    # (copy on write, so Shape.updateSegment can still change them in memory) and a request for fewer orders than
+    # stored is answered with the middle columns. Once the directory grows past maxBytes the least recently used
+    # entries, by modification time, are deleted.
+    def __init__(self, directory, maxBytes=2 ** 28):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(lines):
+        digest = hashlib.sha1()
+        for line in lines:
+            digest.update(np.ascontiguousarray(line.get_Cpoly(), dtype=complex).tobytes())
+            digest.update(np.ascontiguousarray(line.get_time(), dtype=np.float64).tobytes())
+            digest.update(b'|')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def load(self, key, numOrders=None):
+        # numOrders None returns every stored order
+        try:
+            contributions = np.load(self.path(key), mmap_mode='c')
+            stored = contributions.shape[1] // 2
+            if numOrders is None:
+                numOrders = stored
+            if stored < numOrders:
+                return None
+            # mark as recently used, another process may have evicted the entry since it was opened
+            os.utime(self.path(key))
+        except (OSError, ValueError):
+            return None
+        return contributions[:, stored - numOrders:stored + numOrders + 1]
+
+    def store(self, key, contributions):
+        # written under a temporary name first so other processes never load half a file
+        temporary = self.path(key) + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as npy_file:
+            np.save(npy_file, contributions)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.npy')):
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                # removed by another process, or still mapped on a system that will not delete it
+                pass
+
+
 class Shape:
-    def __init__(self, listOfLines, numOrders=50):
+    def __init__(self, listOfLines, numOrders=50, cache=None, tolerance=None, maxOrders=5000):
+        # cache is an optional CoefficientCache. With a tolerance numOrders is ignored and as many orders as needed
+        # to bring the relative error down to it are computed, up to maxOrders.
         self.list = listOfLines
+        self.cache = cache
         self.times = np.array([0])
         for line in self.list[0:-1]:
             # self.times is when each line segment starts in global time
             self.times = np.concatenate([self.times, line.get_time() + self.times[-1]])
         self.T = self.times[-1] + self.list[-1].get_time()
         self.numOrders = numOrders
-        self.fourierSeries(self.numOrders)
+        if tolerance is None:
+            self.fourierSeries(self.numOrders)
+        else:
+            self.adaptiveSeries(tolerance, maxOrders)
 
     def fourierSeries(self, numOrders):
-        self.coefficients = (np.ones(numOrders * 2 + 1) / self.T).astype(complex)
         negativeOrders = -np.flip(np.arange(numOrders + 1))
         strictlyPositiveOrders = np.arange(numOrders) + 1
-        self.orders = np.concatenate((negativeOrders, strictlyPositiveOrders))
-        self.orderIndex = np.arange(len(self.orders))
-        for i, order in enumerate(self.orders):
-            if not order == 0:
-                self.coefficients[i] *= self.integralDotProd(np.array(self.T / (2 * order * np.pi)))
+        orders = np.concatenate((negativeOrders, strictlyPositiveOrders))
+        # one row per segment, one column per order
+        contributions = None
+        if self.cache is not None:
+            key = CoefficientCache.key(self.list)
+            contributions = self.cache.load(key, numOrders)
+        if contributions is None:
+            durations = np.concatenate([line.get_time() for line in self.list])
+            contributions = segment_integrals([line.get_Cpoly() for line in self.list], self.times, durations,
+                                              self.T[0], orders)
+            if self.cache is not None:
+                self.cache.store(key, contributions)
+        self.setContributions(contributions)
+
+    def adaptiveSeries(self, tolerance, maxOrders=5000):
+        # Adds orders +-k outward from 0 until the relative RMS error of the reconstruction, measured about the
+        # curve's mean, is at most tolerance. By Parseval the error needs no sampling,
+        #   (1/T) int |z - z_k|^2 dt = E - sum_{|j|<=k} |c_j|^2,  E = (1/T) int |z|^2 dt
+        # Pairs are computed in blocks that double in size, the stopping k is still the first one that meets the
+        # tolerance. self.numOrders, self.relativeError and self.orderTime (seconds) report the result.
+        start = time.perf_counter()
+        polys = [line.get_Cpoly() for line in self.list]
+        durations = np.concatenate([line.get_time() for line in self.list])
+        energy = curve_energy(polys, durations) / self.T[0]
+        contributions = None
+        if self.cache is not None:
+            key = CoefficientCache.key(self.list)
+            contributions = self.cache.load(key)
+        storedOrders = -1 if contributions is None else contributions.shape[1] // 2
+        if contributions is None:
+            contributions = segment_integrals(polys, self.times, durations, self.T[0], [0])
+        block = 8
+        while True:
+            numOrders = contributions.shape[1] // 2
+            power = np.abs(contributions.sum(axis=0) / self.T[0]) ** 2
+            # energy in orders -k..k for k = 0..numOrders
+            captured = power[numOrders] + np.concatenate(
+                [[0], np.cumsum(power[numOrders + 1:] + power[:numOrders][::-1])])
+            spread = energy - power[numOrders]
+            if spread > 0:
+                errors = np.sqrt(np.maximum(energy - captured, 0) / spread)
             else:
-                # can't use recursive integration for x^nexp(0)
-                integral = 0
-                for line in self.list:
-                    lineEnd = line.get_time()
-                    poly = line.get_Cpoly()
-                    integratedPoly = np.concatenate([[0], [coeff / (1 + i) for i, coeff in enumerate(poly)]])
-                    # since it's a definite integral of a poly and the start of the domain is 0, only evaluate t_f
-                    integral += sum([integratedPoly[n] * lineEnd ** n for n in range(len(poly) + 1)])
-                self.coefficients[i] *= integral
-
-    def integralDotProd(self, a):
-        # a is the reciprocal of the coefficient of x in exp(ix/a)
-        # the function being multiplied by z(t) is exp(-ix/a)
-        integral = 0
-        time = 0
-        for i, line in enumerate(self.list):
-            # get time limits of integration over this segment
-            time = self.times[i]
-            lineStart = 0
-            lineEnd = line.get_time() + lineStart
-            timeStart = time
-            timeEnd = line.get_time() + timeStart
-            poly = line.get_Cpoly()
-            integralPoly = np.zeros(len(poly)).astype(complex)
-            for n, coeff in enumerate(poly):
-                # n is the order I(n), coeff is the trailing coeff
-                for j in np.arange(n + 1):
-                    integralPoly[n - j] += np.array(coeff) * (a * 1j) ** (j + 1) * (-1) ** j * math.factorial(
-                        n) / math.factorial(n - j)
-            I_f = np.exp(timeEnd / (1j * a)) * sum([integralPoly[n] * lineEnd ** n for n in range(len(poly))])
-            I_i = np.exp(timeStart / (1j * a)) * sum([integralPoly[n] * lineStart ** n for n in range(len(poly))])
-            integral += I_f - I_i
-        return integral
-
-    def regeneratePoints(self):
-        # samples = np.zeros(200*len(self.list)).astype(complex)
-        samples = np.array([sum(
-            [self.coefficients[i] * np.exp(1j * order * 2 * np.pi * t / self.T) for i, order in enumerate(self.orders)])
-                            for t in np.linspace(0, self.T, 80 * len(self.list))])
-        # for k, t in enumerate(np.linspace(0,self.T, 200*len(self.list))):
-        #    samples[k] = sum([self.coefficients[i]*np.exp(1j*order*2*np.pi*t/self.T) for i, order in enumerate(self.orders)])
-        return np.squeeze(samples)
+                # a single point, nothing to approximate
+                errors = np.zeros(numOrders + 1)
+            met = np.nonzero(errors <= tolerance)[0]
+            if len(met) or numOrders >= maxOrders:
+                chosen = met[0] if len(met) else numOrders
+                break
+            newOrders = np.arange(numOrders + 1, min(numOrders + block, maxOrders) + 1)
+            pairs = segment_integrals(polys, self.times, durations, self.T[0],
+                                      np.concatenate([-np.flip(newOrders), newOrders]))
+            contributions = np.concatenate([pairs[:, :len(newOrders)], contributions, pairs[:, len(newOrders):]],
+                                           axis=1)
+            block *= 2
+        if self.cache is not None and numOrders > storedOrders:
+            self.cache.store(key, contributions)
+        self.setContributions(contributions[:, numOrders - chosen:numOrders + chosen + 1])
+        self.numOrders = chosen
+        self.relativeError = errors[chosen]
+        self.orderTime = time.perf_counter() - start
+
+    def setContributions(self, contributions):
+        # contributions has one row per segment and one column per order -N..N
+        numOrders = contributions.shape[1] // 2
+        self.orders = np.arange(-numOrders, numOrders + 1)
+        self.orderIndex = np.arange(len(self.orders))
+        self.contributions = contributions
+        self.coefficients = self.contributions.sum(axis=0) / self.T
+        self.phasorCache = {}
+
+    def updateSegment(self, index):
+        # Call after self.list[index] has new points but the same duration. Only that segment's row of
+        # self.contributions is recomputed and the difference is added onto the coefficients.
+        line = self.list[index]
+        row = segment_integrals([line.get_Cpoly()], self.times[index:index + 1], line.get_time(), self.T[0],
+                                self.orders)[0]
+        self.coefficients += (row - self.contributions[index]) / self.T
+        self.contributions[index] = row
+
+    def regeneratePoints(self, numSamples=None, spacing=None):
+        # Samples the series at numSamples evenly spaced times over [0, T], both ends included. The first
+        # numSamples - 1 samples are an inverse DFT of the coefficients with the orders folded mod numSamples - 1,
+        # which is exact for any sample count, and the last closes the loop.
+        # With a spacing the samples are instead taken at even arc length steps along the segments, about
+        # spacing apart, and numSamples is ignored. They are read off a dense even grid from the inverse DFT,
+        # interpolated linearly, rather than summing the series at every one of them.
+        if spacing is not None:
+            index, t = times_by_length(self.list, spacing)
+            numGrid = 8 * max(len(t), len(self.orders)) + 1
+            grid = self.regeneratePoints(numGrid)
+            return np.interp(self.times[index] + t, np.linspace(0, self.T[0], numGrid), grid)
+        if numSamples is None:
+            numSamples = 80 * len(self.list)
+        spectrum = np.zeros(numSamples - 1).astype(complex)
+        np.add.at(spectrum, self.orders % (numSamples - 1), self.coefficients)
+        samples = np.fft.ifft(spectrum) * (numSamples - 1)
+        return np.append(samples, samples[0])
+
+    def iterPoints(self, numSamples=None, chunkSize=1024):
+        # Yields the samples of regeneratePoints in chunks so dense reconstructions can be drawn as they arrive.
+        # Every chunk reuses one cached phasor matrix, shifted in time by rotating the coefficients.
+        if numSamples is None:
+            numSamples = 80 * len(self.list)
+        step = self.T[0] / (numSamples - 1)
+        phasors = self.phasorMatrix(chunkSize, step)
+        for start in range(0, numSamples, chunkSize):
+            count = min(chunkSize, numSamples - start)
+            shifted = self.coefficients * np.exp(2j * np.pi * self.orders * start * step / self.T[0])
+            yield phasors[:count] @ shifted
+
+    def phasorMatrix(self, numSamples, step):
+        # exp(2 pi i k t / T) for t = 0, step, .. and every order, kept between calls
+        key = (numSamples, step)
+        if key not in self.phasorCache:
+            t = np.arange(numSamples) * step
+            self.phasorCache[key] = np.exp(2j * np.pi * np.outer(t, self.orders) / self.T[0])
+        return self.phasorCache[key]
 
     def getTransformData(self):
         return self.coefficients, self.T
 
 
+class TurtleRenderer:
+    # Draws each named curve with its own RawTurtle, one setpos per point
+    def __init__(self, screen):
+        self.screen = screen
+        self.turtles = {}
+
+    def draw(self, name, points, color):
+        if name not in self.turtles:
+            self.turtles[name] = turtle.RawTurtle(self.screen)
+        t = self.turtles[name]
+        t.clear()
+        t.screen.setworldcoordinates(0, 1, 1, 0)
+        t.up()
+        t.ht()
+        t.width(5)
+        t.pencolor(color)
+        t.speed('fastest')
+        t.setpos(points[0, 0], points[0, 1])
+        t.down()
+        for slc in points:
+            t.setpos(slc[0], slc[1])
+        t.up()
+
+    def clear(self):
+        for t in self.turtles.values():
+            t.clear()
+
+
+class CanvasRenderer:
+    # Keeps one persistent line item per named curve and replaces all of its points with a single coords call
+    def __init__(self, screen):
+        self.screen = screen
+        self.items = {}
+        self.points = {}
+        self.screen.bind('<Configure>', self.rescale, add='+')
+
+    def draw(self, name, points, color):
+        if name not in self.items:
+            self.items[name] = self.screen.create_line(0, 0, 0, 0, width=5, capstyle=tk.ROUND, joinstyle=tk.ROUND)
+        self.points[name] = points
+        self.screen.itemconfigure(self.items[name], fill=color, state=tk.NORMAL)
+        self.screen.coords(self.items[name], self.to_pixels(points))
+
+    def to_pixels(self, points):
+        # points are relative to the canvas size, the origin is wherever the canvas view currently starts
+        # (a turtle screen on the same canvas moves it to the middle)
+        scale = [self.screen.winfo_width(), self.screen.winfo_height()]
+        origin = [self.screen.canvasx(0), self.screen.canvasy(0)]
+        return (points * scale + origin).ravel().tolist()
+
+    def rescale(self, event=None):
+        for name, item in self.items.items():
+            self.screen.coords(item, self.to_pixels(self.points[name]))
+
+    def clear(self):
+        for item in self.items.values():
+            self.screen.itemconfigure(item, state=tk.HIDDEN)
+
+
+class EpicycleView:
+    # Animates the chain of rotating phasors c_k exp(2 pi i k t / T) whose tip traces the transformed shape.
+    # The chain starts at order 0 and adds the other terms biggest first, only the numCircles biggest get a circle.
+    # Only the maxTerms biggest terms get an arm of their own, a last arm carries the rest of the series so the
+    # chain still ends on the trace.
+    # One trip round the shape takes period milliseconds of wall clock time, whatever the frame rate achieved.
+    def __init__(self, renderer, coefficients, framerate=60, period=10000, numCircles=20, maxTerms=200):
+        self.renderer = renderer
+        self.screen = renderer.screen
+        self.framelength = round(1000 / framerate)
+        self.period = period
+        self.numFrames = max(1, round(period / self.framelength))
+        self.numCircles = numCircles
+        self.maxTerms = maxTerms
+        # every canvas item is created once and only moved by coords afterwards, circles as the chain needs them
+        self.trail = self.screen.create_line(0, 0, 0, 0, width=3, fill="#ff00ff")
+        self.arms = self.screen.create_line(0, 0, 0, 0, width=1, fill="#404040")
+        self.circles = []
+        self.rotations = None
+        self.set_coefficients(coefficients)
+        self.startTime = time.perf_counter()
+        self.job = None
+        self.step()
+
+    def set_coefficients(self, coefficients):
+        # coefficients are ordered -N..N as Shape keeps them
+        coefficients = np.asarray(coefficients)
+        center = len(coefficients) // 2
+        orders = np.arange(len(coefficients)) - center
+        bySize = np.argsort(-np.abs(coefficients))
+        self.chainOrder = np.concatenate([[center], bySize[bySize != center]])[:self.maxTerms + 1]
+        self.coefficients = coefficients[self.chainOrder]
+        # unit phasor of every chained order at every frame, one row per frame and a column per order in increasing
+        # order. A drag that keeps the same biggest terms reuses the table, only their place in the chain changes.
+        chainOrders = orders[self.chainOrder]
+        tableOrders = np.sort(chainOrders)
+        if self.rotations is None or not np.array_equal(tableOrders, self.rotationOrders):
+            self.rotationOrders = tableOrders
+            self.rotations = np.exp(2j * np.pi * np.outer(np.arange(self.numFrames) / self.numFrames, tableOrders))
+        self.chainColumns = np.searchsorted(self.rotationOrders, chainOrders)
+        # where the tip is at every frame, an inverse DFT of every order folded onto the frames
+        spectrum = np.zeros(self.numFrames).astype(complex)
+        np.add.at(spectrum, orders % self.numFrames, coefficients)
+        self.trace = np.fft.ifft(spectrum) * self.numFrames
+        numCircles = min(self.numCircles, len(self.coefficients) - 1)
+        while len(self.circles) < numCircles:
+            self.circles.append(self.screen.create_oval(0, 0, 0, 0, outline="#606060"))
+        while len(self.circles) > numCircles:
+            self.screen.delete(self.circles.pop())
+
+    def step(self):
+        start = time.perf_counter()
+        frame = int((start - self.startTime) * 1000 / self.period * self.numFrames) % self.numFrames
+        joints = np.append(np.cumsum(self.rotations[frame, self.chainColumns] * self.coefficients),
+                           self.trace[frame])
+        pixels = np.array(self.renderer.to_pixels(np.rollaxis(np.array([joints.real, joints.imag]), 1)))
+        pixels = pixels.reshape(-1, 2)
+        self.screen.coords(self.arms, pixels.ravel().tolist())
+        # a circle for term i is centred on the joint before it, with the term's magnitude as its radius
+        scale = np.array([self.screen.winfo_width(), self.screen.winfo_height()])
+        radii = np.abs(self.coefficients[1:len(self.circles) + 1])[:, None] * scale
+        boxes = np.concatenate([pixels[:len(self.circles)] - radii, pixels[:len(self.circles)] + radii], axis=1)
+        for circle, box in zip(self.circles, boxes.tolist()):
+            self.screen.coords(circle, box)
+        trace = self.trace[:frame + 1]
+        if len(trace) < 2:
+            trace = self.trace[[0, 0]]
+        self.screen.coords(self.trail, self.renderer.to_pixels(np.rollaxis(np.array([trace.real, trace.imag]), 1)))
+        elapsed = round(1000 * (time.perf_counter() - start))
+        self.job = self.screen.after(max(1, self.framelength - elapsed), self.step)
+
+    def stop(self):
+        if self.job is not None:
+            self.screen.after_cancel(self.job)
+        for item in [self.trail, self.arms] + self.circles:
+            self.screen.delete(item)
+
+
 class DrawScreen:
-    def __init__(self):
-        print('d: delete last, <Return>: interpolate, n: fourier transform')
+    fits = {'curve': Curve, 'spline': Spline}
+
+    def __init__(self, renderer='canvas', livePreview=True, framerate=30, fit='curve',
+                 cacheDir=None, tolerance=None,
+                 spacing=0.03):
+        print('d: delete last, <Return>: interpolate, n: fourier transform, r: switch renderer, l: live preview, '
+              's: switch between polynomial and spline fits, e: epicycles, '
+              'a: cycle the fourier error tolerance (off uses 50 orders), f: freehand drawing')
         self.root = tk.Tk()
         self.root.geometry('800x800')
         self.root.bind('<Return>', self.draw)
         self.root.bind('<FocusIn>', self.square_window)
         self.root.bind('d', self.deleteLast)
         self.root.bind('n', self.generate)
-        self.firstDrawing = False
-        self.secondDrawing = False
+        self.root.bind('r', self.switch_renderer)
+        self.root.bind('l', self.toggle_preview)
+        self.root.bind('s', self.switch_fit)
+        self.root.bind('e', self.toggle_epicycles)
+        self.root.bind('a', self.cycle_tolerance)
+        self.root.bind('f', self.toggle_freehand)
         self.hasFourier = False
         self.screen = tk.Canvas(master=self.root, height=800, width=800, bg="#a0ebbb")
         self.screen.pack(fill=tk.BOTH, expand=True)
@@ -209,8 +828,46 @@ class DrawScreen:
                                                                            relheight=0.1, bordermode='inside')
         tk.Label(master=self.screen, text='Add Curve', font=('', 12)).place(rely=0.12, relwidth=0.1, relx=0.78,
                                                                             relheight=0.1, bordermode='inside')
-        self.t = turtle.RawTurtle(self.screen)
-        self.t.ht()
+        tk.Button(master=self.screen, text='renderer', command=self.switch_renderer, borderwidth=10,
+                  relief=tk.GROOVE).place(rely=0.6, relheight=0.1, relx=0.9, relwidth=0.1, bordermode='inside')
+        self.timingLabel = tk.Label(master=self.screen, text='', font=('', 10), justify=tk.LEFT)
+        self.timingLabel.place(rely=0.72, relwidth=0.2, relx=0.8, relheight=0.08, bordermode='inside')
+        tk.Button(master=self.screen, text='epicycles', command=self.toggle_epicycles, borderwidth=10,
+                  relief=tk.GROOVE).place(rely=0.82, relheight=0.1, relx=0.9, relwidth=0.1, bordermode='inside')
+        self.renderers = {'canvas': CanvasRenderer(self.screen), 'turtle': TurtleRenderer(self.screen)}
+        self.renderer = renderer
+        # last drawn points and colour of each curve, so a new renderer can redraw them
+        self.curves = {}
+        # milliseconds the last redraw took with each renderer
+        self.timings = {}
+        # while dragging, shapes are only marked dirty and redrawn together at most once per frame
+        self.livePreview = livePreview
+        self.framelength = round(1000 / framerate)
+        self.dirtyShapes = set()
+        self.refreshJob = None
+        self.lastRefresh = 0
+        # 'curve' fits one polynomial through each shape's points, 'spline' a cubic spline
+        self.fit = fit
+        self.epicycles = None
+        # with a directory, e.g. ~/.fourier2d_cache, transforms of drawings seen before are read back from disk.
+        # Off by default, nothing is written unless asked for.
+        self.cache = CoefficientCache(cacheDir) if cacheDir is not None else None
+        # relative error the fourier orders are chosen for, None for a fixed 50 orders
+        self.tolerance = tolerance
+        self.fourierReport = ''
+        # curves are drawn with points spread evenly along their length about this far apart, relative to the
+        # canvas size, None samples evenly in each segment's parameter instead
+        self.spacing = spacing
+        # freehand strokes on the canvas; motion closer than strokeSpacing to the last recorded point is dropped as
+        # it comes in, and the stroke is simplified to strokeTolerance when the button is released
+        self.freehand = False
+        self.strokeSpacing = 0.005
+        self.strokeTolerance = 0.002
+        self.stroke = []
+        self.strokeItem = None
+        self.screen.bind('<ButtonPress-1>', self.stroke_start)
+        self.screen.bind('<B1-Motion>', self.stroke_move)
+        self.screen.bind('<ButtonRelease-1>', self.stroke_end)
         self.root.mainloop()
 
     def square_window(self, event):
@@ -222,38 +879,100 @@ class DrawScreen:
         if len(self.shapelist) != 0:
             # Force last point of previous shape at same point at first point of current shape
             lp = self.shapelist[-1].last_point()
-            self.shapelist.append(GraphicalShape(np.concatenate([[lp], np.random.rand(1, 2) * 0.8]), self.screen))
+            self.shapelist.append(GraphicalShape(np.concatenate([[lp], np.random.rand(1, 2) * 0.8]), self.screen,
+                                                 self.shape_moved))
         else:
-            self.shapelist.append(GraphicalShape(np.random.rand(2, 2) * 0.8, self.screen))
+            self.shapelist.append(GraphicalShape(np.random.rand(2, 2) * 0.8, self.screen, self.shape_moved))
 
     def addcurve(self):
         if len(self.shapelist) != 0:
             lp = self.shapelist[-1].last_point()
-            self.shapelist.append(GraphicalShape(np.concatenate([[lp], np.random.rand(4, 2) * 0.8]), self.screen))
+            self.shapelist.append(GraphicalShape(np.concatenate([[lp], np.random.rand(4, 2) * 0.8]), self.screen,
+                                                 self.shape_moved))
         else:
-            self.shapelist.append(GraphicalShape(np.random.rand(5, 2) * 0.8, self.screen))
+            self.shapelist.append(GraphicalShape(np.random.rand(5, 2) * 0.8, self.screen, self.shape_moved))
+
+    def toggle_freehand(self, event=None):
+        self.freehand = not self.freehand
+        print('freehand:', self.freehand)
+
+    def stroke_start(self, event):
+        if not self.freehand:
+            return
+        self.stroke = []
+        self.strokeItem = self.screen.create_line(0, 0, 0, 0, width=2, fill="#505050")
+        self.stroke_move(event)
+
+    def stroke_move(self, event):
+        if not self.freehand or self.strokeItem is None:
+            return
+        point = [event.x / self.screen.winfo_width(), event.y / self.screen.winfo_height()]
+        if self.stroke:
+            last = self.stroke[-1]
+            if math.hypot(point[0] - last[0], point[1] - last[1]) < self.strokeSpacing:
+                return
+        self.stroke.append(point)
+        # a line item needs two points, the first sample is doubled until there is a second
+        pixels = self.renderers['canvas'].to_pixels(np.array(self.stroke + self.stroke[-1:]))
+        self.screen.coords(self.strokeItem, pixels)
+
+    def stroke_end(self, event):
+        if not self.freehand or self.strokeItem is None:
+            return
+        self.screen.delete(self.strokeItem)
+        self.strokeItem = None
+        points = np.array(self.stroke)
+        if len(points) < 2:
+            return
+        points = points[simplify_stroke(points, self.strokeTolerance)]
+        if len(self.shapelist) != 0:
+            # joined on to the end of the drawing as addline and addcurve are
+            points = np.concatenate([[self.shapelist[-1].last_point()], points])
+        for piece in split_stroke(points):
+            self.shapelist.append(GraphicalShape(piece, self.screen, self.shape_moved))
+        if self.livePreview:
+            self.draw()
 
     def draw(self, event=None):
-        if self.firstDrawing:
-            self.t.clear()
-            self.firstDrawing = False
-            self.secondDrawing = False
-        self.t.screen.setworldcoordinates(0, 1, 1, 0)
-        self.t.up()
-        self.t.ht()
-        self.t.width(5)
-        self.t.pencolor("#000000")
-        self.t.speed('fastest')
+        if len(self.shapelist) == 0:
+            return
+        # refit every moved shape in one batch, the rest keep their cached samples
+        interpolate_shapes([s for s in self.shapelist if s.samples is None], fit=self.fit, spacing=self.spacing)
         allPoints = np.empty((0, 2))
         for s in self.shapelist:
-            points = s.interpolate()
+            points = s.interpolate(self.fit, self.spacing)
             allPoints = np.concatenate([allPoints, points])
-        self.t.setpos(allPoints[0, 0], allPoints[0, 1])
-        self.t.down()
-        for slc in allPoints:
-            self.t.setpos(slc[0], slc[1])
-        self.t.up()
-        self.firstDrawing = True
+        self.render('interpolation', allPoints, "#000000")
+
+    def render(self, name, points, color):
+        self.curves[name] = (points, color)
+        start = time.perf_counter()
+        self.renderers[self.renderer].draw(name, points, color)
+        self.screen.update_idletasks()
+        self.timings[self.renderer] = 1000 * (time.perf_counter() - start)
+        self.timingLabel['text'] = '\n'.join(
+            ['{}: {:.1f} ms'.format(renderer, ms) for renderer, ms in sorted(self.timings.items())] +
+            [self.fourierReport])
+
+    def switch_fit(self, event=None):
+        self.fit = 'spline' if self.fit == 'curve' else 'curve'
+        for s in self.shapelist:
+            s.samples = None
+
+    def cycle_tolerance(self, event=None):
+        tolerances = [None, 0.05, 0.02, 0.01, 0.005]
+        self.tolerance = tolerances[(tolerances.index(self.tolerance) + 1) % len(tolerances)
+                                    if self.tolerance in tolerances else 0]
+        print('fourier tolerance:', self.tolerance)
+
+    def toggle_preview(self, event=None):
+        self.livePreview = not self.livePreview
+
+    def switch_renderer(self, event=None):
+        self.renderers[self.renderer].clear()
+        self.renderer = 'turtle' if self.renderer == 'canvas' else 'canvas'
+        for name, (points, color) in list(self.curves.items()):
+            self.render(name, points, color)
 
     def deleteLast(self, event=None):
         if len(self.shapelist) is not 0:
@@ -262,31 +981,66 @@ class DrawScreen:
 
     def generate(self, event=None):
         linelist = []
+        # the shapes the transform was taken from, their fits, and the indices of each fit's segments in linelist
+        self.fourierShapes = list(self.shapelist)
+        self.fourierFits = []
+        self.fourierSegments = []
         for s in self.shapelist:
             p = np.rollaxis(s.get_points(), 1)
-            linelist.append(Curve(p))
-        self.totalShape = Shape(linelist, 50)
-        zcoords = self.totalShape.regeneratePoints()
+            fit = self.fits[self.fit](p)
+            self.fourierSegments.append(range(len(linelist), len(linelist) + len(fit.get_pieces())))
+            self.fourierFits.append(fit)
+            linelist.extend(fit.get_pieces())
+        start = time.perf_counter()
+        self.totalShape = Shape(linelist, 50, self.cache, self.tolerance)
+        self.fourierReport = 'fourier: {} orders, {:.1f} ms'.format(self.totalShape.numOrders,
+                                                                      1000 * (time.perf_counter() - start))
+        if self.tolerance is not None:
+            self.fourierReport += ', err {:.2g}'.format(self.totalShape.relativeError)
+        print(self.fourierReport)
+        self.drawFourier()
+        self.hasFourier = True
+
+    def drawFourier(self):
+        zcoords = self.totalShape.regeneratePoints(spacing=self.spacing)
         points = np.array([np.real(zcoords), np.imag(zcoords)])
         points = np.rollaxis(points, 1)
-        points = points
-        if self.secondDrawing:
-            self.t.clear()
-            self.secondDrawing = False
-            self.firstDrawing = False
-        self.t.screen.setworldcoordinates(0, 1, 1, 0)
-        self.t.up()
-        self.t.ht()
-        self.t.width(5)
-        self.t.pencolor("#00ffff")
-        self.t.speed('fastest')
-        self.t.setpos(points[0, 0], points[0, 1])
-        self.t.down()
-        for slc in points:
-            self.t.setpos(slc[0], slc[1])
-        self.t.up()
-        self.secondDrawing = True
-        self.hasFourier = True
+        self.render('fourier', points, "#00ffff")
+        if self.epicycles is not None:
+            self.epicycles.set_coefficients(self.totalShape.coefficients)
+
+    def toggle_epicycles(self, event=None):
+        if self.epicycles is not None:
+            self.epicycles.stop()
+            self.epicycles = None
+        elif self.hasFourier:
+            coefficients, T = self.get_coeffs()
+            self.epicycles = EpicycleView(self.renderers['canvas'], coefficients)
+
+    def shape_moved(self, shape):
+        # Called on every drag event, so only mark the shape and leave the redraw to a single scheduled refresh
+        self.dirtyShapes.add(shape)
+        if self.refreshJob is None:
+            wait = self.lastRefresh + self.framelength - 1000 * time.perf_counter()
+            self.refreshJob = self.root.after(max(0, round(wait)), self.refresh)
+
+    def refresh(self):
+        self.refreshJob = None
+        self.lastRefresh = 1000 * time.perf_counter()
+        dirty = self.dirtyShapes
+        self.dirtyShapes = set()
+        if self.livePreview:
+            # shapes that did not move return their cached samples
+            self.draw()
+        if self.hasFourier:
+            # refit only the moved segments of the transform, each adds its difference onto the coefficients
+            moved = [index for index, shape in enumerate(self.fourierShapes) if shape in dirty]
+            for index in moved:
+                self.fourierFits[index].set_points(np.rollaxis(self.fourierShapes[index].get_points(), 1))
+                for segment in self.fourierSegments[index]:
+                    self.totalShape.updateSegment(segment)
+            if moved:
+                self.drawFourier()
 
     def get_coeffs(self):
         if self.hasFourier:
@@ -294,20 +1048,26 @@ class DrawScreen:
 
 
 class GraphicalShape:
-    def __init__(self, points, screen):
+    def __init__(self, points, screen, on_move=None):
+        # on_move(shape) is called whenever one of the shape's nodes is dragged
         self.points = points
+        self.on_move = on_move
+        # interpolated points, kept until a node moves
+        self.samples = None
         self.nodes = []
         for point in points:
-            self.nodes.append(Node(point, screen))
+            self.nodes.append(Node(point, screen, self.moved))
+
+    def moved(self):
+        self.samples = None
+        if self.on_move is not None:
+            self.on_move(self)
 
-    def interpolate(self):
+    def interpolate(self, fit='curve', spacing=None):
         # gets coefficients for current points and returns a bunch of points along that polynomial
-        t = np.arange(len(self.points))
-        xcoeffs = get_lagrange(t, self.points[:, 0])
-        ycoeffs = get_lagrange(t, self.points[:, 1])
-        interpolatedPoints = np.array([Poly(xcoeffs).sample(np.linspace(t[0], t[-1], 50)),
-                                       Poly(ycoeffs).sample(np.linspace(t[0], t[-1], 50))])
-        return np.rollaxis(interpolatedPoints, 1)
+        if self.samples is None:
+            interpolate_shapes([self], fit=fit, spacing=spacing)
+        return self.samples
 
     def get_points(self):
         return self.points
@@ -321,11 +1081,12 @@ class GraphicalShape:
 
 
 class Node:
-    def __init__(self, point, screen):
+    def __init__(self, point, screen, on_move=None):
         # point is a slice of a numpy array which is held by GraphicalShape, any change to self.point through indexing
         # is therefore reflected by a change in GraphicalShape.points
         self.point = point
         self.master = screen
+        self.on_move = on_move
         self.widget = tk.Frame(master=self.master, bg='red')
         self.widget.place(relx=self.point[0], rely=self.point[1], relheight=0.01, relwidth=0.01,
                           bordermode='outside')
@@ -335,8 +1096,12 @@ class Node:
         self.point[0] = (self.widget.winfo_x() + event.x) / self.master.winfo_width()
         self.point[1] = (self.widget.winfo_y() + event.y) / self.master.winfo_height()
         self.widget.place_configure(relx=self.point[0], rely=self.point[1])
+        if self.on_move is not None:
+            self.on_move()
 
     def destroy(self):
         self.widget.destroy()
 
-drawscreen = DrawScreen()
\ No newline at end of file
+
+if __name__ == '__main__':
+    drawscreen = DrawScreen()
@@ -0,0 +1,291 @@
+import math
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from Fourier2D import (get_lagrange, interpolate_shapes, sample_by_length, times_by_length, CoefficientCache, Curve,
+                       Shape, Spline)
+
+
+def lagrange_take_sums(x, y):
+    # The original get_lagrange, kept as the reference for the benchmark. Enumerating the elementary
+    # symmetric sums recursively is exponential in len(x).
+    def take_sums(x, at_a_time):
+        if at_a_time == 0:
+            return 1
+        else:
+            return sum([x[ind] * take_sums(x[ind + 1:], at_a_time - 1) for ind in range(len(x) - at_a_time + 1)])
+
+    x = np.array(x)
+    y = np.array(y)
+    n = len(x)
+    order = n - 1
+    coeffs = np.array([0] * n).astype(np.float64)
+    for i in range(n):
+        minusx = np.delete(np.copy(x), i) * -1
+        sums = np.array([1] * n)
+        for m in range(order):
+            sums[-2 - m] = take_sums(minusx, m + 1)
+        coeffs += y[i] * sums / np.prod([x[i] + minusx[j] for j in range(order)])
+    return coeffs
+
+
+def time_call(func, *args, repeats=3):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_lagrange(sizes=(2, 4, 6, 8, 10, 12, 14, 16, 25, 50, 100, 200), old_limit=16):
+    # Interpolation through n random points at t = 0..n-1, as Curve does. The recursive path is only
+    # run up to old_limit points, past that it takes minutes.
+    rng = np.random.default_rng(0)
+    print('{:>5} {:>12} {:>12} {:>12}'.format('n', 'old (ms)', 'new (ms)', 'max rel err'))
+    for n in sizes:
+        t = np.arange(n)
+        y = rng.random(n) * 0.8
+        newTime, newCoeffs = time_call(get_lagrange, t, y)
+        if n <= old_limit:
+            oldTime, oldCoeffs = time_call(lagrange_take_sums, t, y, repeats=1)
+            err = np.max(np.abs(newCoeffs - oldCoeffs) / np.maximum(np.abs(oldCoeffs), 1e-300))
+            print('{:>5} {:>12.3f} {:>12.3f} {:>12.2e}'.format(n, oldTime * 1000, newTime * 1000, err))
+        else:
+            print('{:>5} {:>12} {:>12.3f} {:>12}'.format(n, '-', newTime * 1000, '-'))
+
+
+def integral_dot_prod(shape, a):
+    # The original per order Shape.integralDotProd, kept as the reference for the benchmark
+    # a is the reciprocal of the coefficient of x in exp(ix/a)
+    # the function being multiplied by z(t) is exp(-ix/a)
+    integral = 0
+    for i, line in enumerate(shape.list):
+        # get time limits of integration over this segment
+        lineStart = 0
+        lineEnd = line.get_time() + lineStart
+        timeStart = shape.times[i]
+        timeEnd = line.get_time() + timeStart
+        poly = line.get_Cpoly()
+        integralPoly = np.zeros(len(poly)).astype(complex)
+        for n, coeff in enumerate(poly):
+            # n is the order I(n), coeff is the trailing coeff
+            for j in np.arange(n + 1):
+                integralPoly[n - j] += np.array(coeff) * (a * 1j) ** (j + 1) * (-1) ** j * math.factorial(
+                    n) / math.factorial(n - j)
+        I_f = np.exp(timeEnd / (1j * a)) * sum([integralPoly[n] * lineEnd ** n for n in range(len(poly))])
+        I_i = np.exp(timeStart / (1j * a)) * sum([integralPoly[n] * lineStart ** n for n in range(len(poly))])
+        integral += I_f - I_i
+    return integral
+
+
+def fourier_series_loop(shape, numOrders):
+    # The original per order Shape.fourierSeries, kept as the reference for the benchmark
+    coefficients = (np.ones(numOrders * 2 + 1) / shape.T[0]).astype(complex)
+    orders = np.concatenate((-np.flip(np.arange(numOrders + 1)), np.arange(numOrders) + 1))
+    for i, order in enumerate(orders):
+        if not order == 0:
+            coefficients[i] *= np.squeeze(integral_dot_prod(shape, np.array(shape.T[0] / (2 * order * np.pi))))
+        else:
+            integral = 0
+            for line in shape.list:
+                lineEnd = line.get_time()
+                poly = line.get_Cpoly()
+                integratedPoly = np.concatenate([[0], [coeff / (1 + i) for i, coeff in enumerate(poly)]])
+                integral += sum([integratedPoly[n] * lineEnd ** n for n in range(len(poly) + 1)])
+            coefficients[i] *= np.squeeze(integral)
+    return coefficients
+
+
+def random_curves(numSegments, pointsPerSegment=5, seed=0):
+    # Joined random segments as DrawScreen.addcurve builds them, each starting on the last point of the previous
+    rng = np.random.default_rng(seed)
+    curves = []
+    lastPoint = rng.random(2) * 0.8
+    for _ in range(numSegments):
+        points = np.concatenate([[lastPoint], rng.random((pointsPerSegment - 1, 2)) * 0.8])
+        curves.append(Curve(np.rollaxis(points, 1)))
+        lastPoint = points[-1]
+    return curves
+
+
+def bench_fourier(orderCounts=(50, 200, 1000, 5000), numSegments=20, old_limit=1000):
+    curves = random_curves(numSegments)
+    print('{:>6} {:>12} {:>12} {:>12}'.format('orders', 'old (ms)', 'new (ms)', 'max abs err'))
+    for numOrders in orderCounts:
+        newTime, shape = time_call(Shape, curves, numOrders)
+        if numOrders <= old_limit:
+            oldTime, oldCoeffs = time_call(fourier_series_loop, shape, numOrders, repeats=1)
+            err = np.max(np.abs(shape.coefficients - oldCoeffs))
+            print('{:>6} {:>12.3f} {:>12.3f} {:>12.2e}'.format(numOrders, oldTime * 1000, newTime * 1000, err))
+        else:
+            print('{:>6} {:>12} {:>12.3f} {:>12}'.format(numOrders, '-', newTime * 1000, '-'))
+
+
+def regenerate_points_loop(shape, numSamples):
+    # The original Shape.regeneratePoints with the sample count exposed, kept as the reference for the benchmark
+    return np.squeeze(np.array([sum(
+        [shape.coefficients[i] * np.exp(1j * order * 2 * np.pi * t / shape.T) for i, order in enumerate(shape.orders)])
+        for t in np.linspace(0, shape.T[0], numSamples)]))
+
+
+def bench_synthesis(sampleCounts=(400, 1600, 6400, 100000), numOrders=50, numSegments=5, old_limit=1600):
+    shape = Shape(random_curves(numSegments), numOrders)
+    print('{:>7} {:>12} {:>12} {:>12} {:>12}'.format('samples', 'old (ms)', 'fft (ms)', 'chunks (ms)', 'max abs err'))
+    for numSamples in sampleCounts:
+        fftTime, points = time_call(shape.regeneratePoints, numSamples)
+        chunkTime, chunks = time_call(lambda: np.concatenate(list(shape.iterPoints(numSamples))))
+        if numSamples <= old_limit:
+            oldTime, oldPoints = time_call(regenerate_points_loop, shape, numSamples, repeats=1)
+            err = max(np.max(np.abs(points - oldPoints)), np.max(np.abs(chunks - oldPoints)))
+            print('{:>7} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.2e}'.format(numSamples, oldTime * 1000, fftTime * 1000,
+                                                                      chunkTime * 1000, err))
+        else:
+            err = np.max(np.abs(points - chunks))
+            print('{:>7} {:>12} {:>12.3f} {:>12.3f} {:>12.2e}'.format(numSamples, '-', fftTime * 1000,
+                                                                    chunkTime * 1000, err))
+
+
+def bench_drag(segmentCounts=(10, 50, 200), numOrders=500, numDrags=50):
+    # One node moved per drag, compared with rebuilding the Shape as DrawScreen.generate does
+    rng = np.random.default_rng(1)
+    print('{:>8} {:>12} {:>12} {:>12}'.format('segments', 'full (ms)', 'drag (ms)', 'max abs err'))
+    for numSegments in segmentCounts:
+        curves = random_curves(numSegments)
+        shape = Shape(curves, numOrders)
+        start = time.perf_counter()
+        for _ in range(numDrags):
+            index = rng.integers(numSegments)
+            points = np.array([np.real(curves[index].get_points()), np.imag(curves[index].get_points())])
+            points[:, rng.integers(1, points.shape[1])] = rng.random(2) * 0.8
+            curves[index].set_points(points)
+            shape.updateSegment(index)
+        dragTime = (time.perf_counter() - start) / numDrags
+        fullTime, fullShape = time_call(Shape, curves, numOrders)
+        err = np.max(np.abs(shape.coefficients - fullShape.coefficients))
+        print('{:>8} {:>12.3f} {:>12.3f} {:>12.2e}'.format(numSegments, fullTime * 1000, dragTime * 1000, err))
+
+
+def interpolate_loop(points, numSamples=50):
+    # The original GraphicalShape.interpolate with the original Poly.sample, kept as the reference for the benchmark
+    def sample(coeffs, t):
+        return sum([coeffs[n] * t ** n for n in np.arange(len(coeffs))])
+
+    t = np.arange(len(points))
+    xcoeffs = get_lagrange(t, points[:, 0])
+    ycoeffs = get_lagrange(t, points[:, 1])
+    interpolatedPoints = np.array([sample(xcoeffs, np.linspace(t[0], t[-1], numSamples)),
+                                   sample(ycoeffs, np.linspace(t[0], t[-1], numSamples))])
+    return np.rollaxis(interpolatedPoints, 1)
+
+
+class PointSet:
+    # Stands in for GraphicalShape, interpolate_shapes only needs points and writes samples
+    def __init__(self, points):
+        self.points = points
+        self.samples = None
+
+
+def bench_horner(shapeCounts=(10, 100, 500, 2000)):
+    rng = np.random.default_rng(2)
+    print('{:>6} {:>12} {:>12} {:>12}'.format('shapes', 'loop (ms)', 'batch (ms)', 'max abs err'))
+    for numShapes in shapeCounts:
+        # lines and curves as DrawScreen.addline and addcurve make them
+        shapes = [PointSet(rng.random((rng.choice([2, 5]), 2)) * 0.8) for _ in range(numShapes)]
+        loopTime, loopSamples = time_call(lambda: [interpolate_loop(shape.points) for shape in shapes])
+        batchTime, _ = time_call(interpolate_shapes, shapes)
+        err = max(np.max(np.abs(shape.samples - samples)) for shape, samples in zip(shapes, loopSamples))
+        print('{:>6} {:>12.3f} {:>12.3f} {:>12.2e}'.format(numShapes, loopTime * 1000, batchTime * 1000, err))
+
+
+def bench_spline(pointCounts=(5, 50, 500, 5000)):
+    # Fitting one long path, a single polynomial through every point against a cubic spline
+    rng = np.random.default_rng(3)
+    print('{:>6} {:>12} {:>12} {:>14}'.format('points', 'curve (ms)', 'spline (ms)', 'spline+shape'))
+    for numPoints in pointCounts:
+        points = np.cumsum(rng.normal(0, 0.01, (2, numPoints)), axis=1) + 0.5
+        curveTime, _ = time_call(Curve, points)
+        splineTime, spline = time_call(Spline, points)
+        shapeTime, _ = time_call(Shape, spline.get_pieces(), 50)
+        print('{:>6} {:>12.3f} {:>12.3f} {:>14.3f}'.format(numPoints, curveTime * 1000, splineTime * 1000,
+                                                          (splineTime + shapeTime) * 1000))
+
+
+def bench_cache(numSegments=50, numOrders=2000):
+    # A fresh transform, the same drawing read back from the cache, and a smaller request sliced from it
+    curves = random_curves(numSegments)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = CoefficientCache(directory)
+        plainTime, plain = time_call(Shape, curves, numOrders)
+        coldTime, _ = time_call(Shape, curves, numOrders, cache, repeats=1)
+        warmTime, warm = time_call(Shape, curves, numOrders, cache)
+        slicedTime, sliced = time_call(Shape, curves, numOrders // 10, cache)
+        smaller = Shape(curves, numOrders // 10)
+    finally:
+        shutil.rmtree(directory)
+    err = max(np.max(np.abs(warm.coefficients - plain.coefficients)),
+              np.max(np.abs(sliced.coefficients - smaller.coefficients)))
+    print('{:>12} {:>12} {:>12} {:>12} {:>12}'.format('no cache', 'cold (ms)', 'warm (ms)', 'sliced (ms)',
+                                                    'max abs err'))
+    print('{:>12.3f} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.2e}'.format(plainTime * 1000, coldTime * 1000,
+                                                                    warmTime * 1000, slicedTime * 1000, err))
+
+
+def sample_at_direct(shape, t, chunkSize=4096):
+    # The series summed directly at arbitrary times, a phasor matrix product per chunk, kept as the reference for
+    # the arc length reconstruction
+    samples = np.zeros(len(t)).astype(complex)
+    for start in range(0, len(t), chunkSize):
+        phasors = np.exp(2j * np.pi * np.outer(t[start:start + chunkSize], shape.orders) / shape.T[0])
+        samples[start:start + chunkSize] = phasors @ shape.coefficients
+    return samples
+
+
+def bench_arclength(spacings=(0.03, 0.005, 0.001), numSegments=20, fourierSpacing=0.03,
+                    orderCounts=(50, 500, 2000)):
+    # Samples needed for no gap wider than spacing, evenly in each segment's t as interpolate does against evenly
+    # by arc length. The tables are built on the first call and reused after.
+    curves = random_curves(numSegments)
+    print('{:>8} {:>10} {:>10} {:>10} {:>12} {:>12}'.format('spacing', 'uniform t', 'by length', 'max gap',
+                                                           'first (ms)', 'after (ms)'))
+    for spacing in spacings:
+        for curve in curves:
+            curve.arcTable = None
+        firstTime, _ = time_call(sample_by_length, curves, spacing, repeats=1)
+        lengthTime, points = time_call(sample_by_length, curves, spacing)
+        numSamples = 2
+        while True:
+            gaps = [np.max(np.abs(np.diff(curve.zP4.sample(np.linspace(0, curve.get_time()[0], numSamples)))))
+                    for curve in curves]
+            if max(gaps) <= spacing:
+                break
+            numSamples *= 2
+        print('{:>8} {:>10} {:>10} {:>10.2e} {:>12.3f} {:>12.3f}'.format(
+            spacing, numSamples * numSegments, len(points), np.max(np.abs(np.diff(points))), firstTime * 1000,
+            lengthTime * 1000))
+    # the fourier curve at the same steps, read off the inverse DFT grid against summing the series at each one
+    print('{:>8} {:>8} {:>10} {:>12} {:>12} {:>12}'.format('spacing', 'orders', 'samples', 'direct (ms)',
+                                                          'grid (ms)', 'max abs err'))
+    for numOrders in orderCounts:
+        shape = Shape(curves, numOrders)
+        gridTime, points = time_call(shape.regeneratePoints, None, fourierSpacing)
+        index, t = times_by_length(curves, fourierSpacing)
+        directTime, direct = time_call(sample_at_direct, shape, shape.times[index] + t, repeats=1)
+        print('{:>8} {:>8} {:>10} {:>12.3f} {:>12.3f} {:>12.2e}'.format(
+            fourierSpacing, numOrders, len(points), directTime * 1000, gridTime * 1000,
+            np.max(np.abs(points - direct))))
+
+
+benchmarks = {'lagrange': bench_lagrange, 'fourier': bench_fourier, 'synthesis': bench_synthesis, 'drag': bench_drag,
+              'horner': bench_horner, 'spline': bench_spline, 'cache': bench_cache,
+              'arclength': bench_arclength}
+
+if __name__ == '__main__':
+    # python benchmarks.py [name ...], runs everything when no names are given
+    for name in sys.argv[1:] or benchmarks:
+        print(name)
+        benchmarks[name]()
+        print()
@@ -0,0 +1,121 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Fourier2D import CoefficientCache, Shape, DrawScreen
+
+# Headless batch version of DrawScreen.generate. Every input file is one drawing made of segments, each segment
+# a list of x, y points like the ones a GraphicalShape holds:
+#   .json  [[[x, y], ...], ...], a list of segments (a single [[x, y], ...] is one segment)
+#   .csv   x,y rows with an optional third segment column, consecutive rows with the same label form a segment
+#   .npy   shape (points, 2) for one segment or (segments, points, 2)
+# Run from this folder: python fourier_batch.py drawings/*.json -o results.npz
+
+
+def load_segments(path):
+    # Returns the drawing as a list of (2, n) arrays, first row x's, as Curve takes them
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path) as json_file:
+            data = json.load(json_file)
+        segments = [data] if np.ndim(data[0]) == 1 else data
+    elif extension == '.csv':
+        with open(path, newline='') as csv_file:
+            rows = [row for row in csv.reader(csv_file) if row]
+        try:
+            float(rows[0][0])
+        except ValueError:
+            # header row
+            rows = rows[1:]
+        labels = [row[2] if len(row) > 2 else '' for row in rows]
+        segments = []
+        for row, label, previous in zip(rows, labels, [None] + labels[:-1]):
+            if label != previous:
+                segments.append([])
+            segments[-1].append([float(row[0]), float(row[1])])
+    elif extension == '.npy':
+        data = np.load(path)
+        segments = [data] if data.ndim == 2 else list(data)
+    else:
+        raise ValueError('unsupported point file ' + path)
+    return [np.rollaxis(np.array(segment, dtype=np.float64), 1) for segment in segments]
+
+
+def transform(path, numOrders=50, numSamples=400, fit='curve', cache=None):
+    linelist = []
+    for points in load_segments(path):
+        linelist.extend(DrawScreen.fits[fit](points).get_pieces())
+    shape = Shape(linelist, numOrders, cache)
+    coefficients, T = shape.getTransformData()
+    return coefficients, T[0], shape.regeneratePoints(numSamples)
+
+
+def transform_chunk(args):
+    # runs in a worker process, so each task carries a chunk of files rather than one. A file that cannot be read
+    # or transformed comes back as its error message instead, so one bad drawing does not lose the rest.
+    paths, numOrders, numSamples, fit, cacheDir = args
+    cache = CoefficientCache(cacheDir) if cacheDir is not None else None
+    results = []
+    for path in paths:
+        try:
+            results.append(transform(path, numOrders, numSamples, fit, cache))
+        except Exception as error:
+            results.append('{}: {}'.format(type(error).__name__, error))
+    return results
+
+
+def run_batch(paths, output, numOrders=50, numSamples=400, fit='curve', workers=None, chunkSize=16, cacheDir=None):
+    start = time.perf_counter()
+    chunks = [(paths[i:i + chunkSize], numOrders, numSamples, fit, cacheDir) for i in range(0, len(paths), chunkSize)]
+    if workers == 1:
+        results = [result for chunk in chunks for result in transform_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [result for chunkResults in pool.map(transform_chunk, chunks) for result in chunkResults]
+    elapsed = time.perf_counter() - start
+    # the rows of files that failed are NaN, failed marks them and errors says why
+    failed = np.array([isinstance(result, str) for result in results], dtype=bool)
+    coefficients = np.full((len(paths), 2 * numOrders + 1), np.nan, dtype=complex)
+    periods = np.full(len(paths), np.nan)
+    reconstructions = np.full((len(paths), numSamples), np.nan, dtype=complex)
+    for i, result in enumerate(results):
+        if not failed[i]:
+            coefficients[i], periods[i], reconstructions[i] = result
+    errors = np.array([result if failed[i] else '' for i, result in enumerate(results)])
+    np.savez_compressed(output, files=np.array(paths), orders=np.arange(-numOrders, numOrders + 1),
+                        coefficients=coefficients, periods=periods, reconstructions=reconstructions, failed=failed,
+                        errors=errors)
+    return elapsed, failed, errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fourier transform saved point sets without opening a window')
+    parser.add_argument('inputs', nargs='+', help='point files (.json, .csv, .npy) or glob patterns')
+    parser.add_argument('-o', '--output', default='fourier_results.npz')
+    parser.add_argument('-n', '--orders', type=int, default=50, help='orders -n..n are computed')
+    parser.add_argument('-s', '--samples', type=int, default=400, help='points in each reconstruction')
+    parser.add_argument('--fit', choices=sorted(DrawScreen.fits), default='curve')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, default one per cpu')
+    parser.add_argument('--chunk', type=int, default=16, help='files sent to a worker at a time')
+    parser.add_argument('--cache', default=None, help='directory of a coefficient cache shared with Fourier2D')
+    args = parser.parse_args()
+    paths = []
+    for pattern in args.inputs:
+        matches = glob.glob(pattern)
+        if not matches:
+            print('warning: {} matches no files'.format(pattern), file=sys.stderr)
+        paths.extend(matches)
+    paths = sorted(paths)
+    if not paths:
+        parser.error('no input files')
+    elapsed, failed, errors = run_batch(paths, args.output, args.orders, args.samples, args.fit, args.workers,
+                                        args.chunk, args.cache)
+    for path, error in zip(np.array(paths)[failed], errors[failed]):
+        print('failed {}: {}'.format(path, error), file=sys.stderr)
+    print('{} shapes in {:.2f} s, {:.1f} shapes/s, {} failed -> {}'.format(
+        len(paths), elapsed, len(paths) / elapsed, np.sum(failed), args.output))
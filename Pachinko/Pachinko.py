@@ -1,3 +1,7 @@
+import math
+import struct
+import sys
+import time
 import tkinter as tk
 import random as r
 import numpy as np
@@ -53,7 +57,12 @@ class Ball:
 
         self.vy = self.vy + self.accel * timestep
 
-    def check_collisions(self, pin_corners, pin_size):
+    def check_collisions(self, pin_corners, pin_size, pin_grid=None):
+        if pin_grid is not None:
+            # only the pins hashed near the ball can touch it, the test below is unchanged on that subset
+            pin_corners = pin_corners[pin_grid.query(self.x, self.y)]
+            if not len(pin_corners):
+                return
         ball_corner = [self.x, self.y]
         ball_v = [self.vx, self.vy]
         bigboxlen = pin_size + self.ball_size
@@ -74,6 +83,467 @@ class Ball:
         self.vx, self.vy = self.vx + dv[0], self.vy + dv[1]
 
 
+class BallSystem:
+    # Every live ball's state in one set of arrays, stepped together. Does what Ball does for one ball, the
+    # same physics, wall bounce, payout and pin response, with numpy over all of them each frame.
+    ball_size = Ball.ball_size
+    mu = Ball.mu
+
+    def __init__(self, accel, physics, ball_collisions=True, swept=False):
+        self.accel = accel
+        self.ball_collisions = ball_collisions
+        self.swept = swept
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.vx = np.zeros(0)
+        self.vy = np.zeros(0)
+        physicsSwitch = {Physics.FREEFALL: self.update_freefall, Physics.FRICTION: self.update_friction}
+        self.physics = physicsSwitch[physics]
+        motionSwitch = {Physics.FREEFALL: self.freefall_motion, Physics.FRICTION: self.friction_motion}
+        self.motion = motionSwitch[physics]
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, topcoords, vx=None):
+        # one ball or an array of them dropped from the top, with the sideways jitter drawn here unless given
+        topcoords = np.atleast_1d(topcoords)
+        if vx is None:
+            vx = [r.normalvariate(0, 0.00001) for _ in topcoords]
+        self.x = np.append(self.x, topcoords - self.ball_size / 2)
+        self.y = np.append(self.y, np.zeros(len(topcoords)))
+        self.vx = np.append(self.vx, vx)
+        self.vy = np.append(self.vy, np.zeros(len(topcoords)))
+
+    def step_forward(self, timestep, pin_corners=None, pin_size=None, pin_grid=None):
+        # Returns the mask of balls that left the bottom this step, which are removed, their payouts and the x
+        # they left at. Given the pins and with swept on, the step's motion is swept against them, otherwise the
+        # balls only move and check_collisions is left to respond to the pins at the end of the step.
+        if self.swept and pin_grid is not None:
+            self.sweep_pins(timestep, pin_corners, pin_size, pin_grid)
+        else:
+            self.physics(timestep)
+
+        exited = self.y > 1
+        positions = self.x[exited]
+        payouts = np.round((positions - 0.5) ** 4 * 40000).astype(int)
+        if np.any(exited):
+            self.x, self.y, self.vx, self.vy = self.x[~exited], self.y[~exited], self.vx[~exited], self.vy[~exited]
+        offsets = self.x - 0.5 + self.ball_size / 2
+        walls = abs(offsets) > 0.40 - self.ball_size / 2
+        self.vx[walls] *= - np.sign(self.vx[walls]) * np.sign(offsets[walls])
+        return exited, payouts, positions
+
+    def advance(self, timestep, numSteps, pin_corners, pin_size, pin_grid=None):
+        # numSteps steps of timestep each followed by the pin and ball responses, returns every payout and exit x
+        payouts, positions = [], []
+        for _ in range(numSteps):
+            exited, stepPayouts, stepPositions = self.step_forward(timestep, pin_corners, pin_size, pin_grid)
+            payouts.append(stepPayouts)
+            positions.append(stepPositions)
+            if not (self.swept and pin_grid is not None):
+                self.check_collisions(pin_corners, pin_size, pin_grid)
+            if self.ball_collisions:
+                self.collide_balls()
+        if not numSteps:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        return np.concatenate(payouts), np.concatenate(positions)
+
+    def update_friction(self, timestep):
+        self.x, self.y, self.vx, self.vy = self.friction_motion(self.x, self.y, self.vx, self.vy, timestep)
+
+    def update_freefall(self, timestep):
+        self.x, self.y, self.vx, self.vy = self.freefall_motion(self.x, self.y, self.vx, self.vy, timestep)
+
+    def friction_motion(self, x, y, vx, vy, timestep):
+        # x, y, vx, vy after timestep, which may be one for all or an array with one per ball. The motion is
+        # solved exactly, so it does not depend on how the time is split into steps.
+        decay = np.exp(-self.mu * timestep)
+        y = (self.accel / self.mu * timestep - (vy - self.accel / self.mu) / self.mu * decay +
+             (+vy - self.accel / self.mu) / self.mu + y)
+        x = -vx / self.mu * decay + x + vx / self.mu
+        return x, y, vx * decay, self.accel / self.mu + (vy - self.accel / self.mu) * decay
+
+    def freefall_motion(self, x, y, vx, vy, timestep):
+        return x + vx * timestep, y + (vy * timestep + self.accel * 0.5 * timestep ** 2), vx, vy + self.accel * timestep
+
+    def check_collisions(self, pin_corners, pin_size, pin_grid=None):
+        # Ball.check_collisions for every ball, over a flat list of (ball, candidate pin) pairs
+        if not len(self) or not len(pin_corners):
+            return
+        if pin_grid is not None:
+            balls, pins = pin_grid.query_many(self.x, self.y)
+        else:
+            balls = np.repeat(np.arange(len(self)), len(pin_corners))
+            pins = np.tile(np.arange(len(pin_corners)), len(self))
+        ball_corners = np.stack([self.x, self.y], axis=1)
+        bigboxlen = pin_size + self.ball_size
+        bigboxcenters = pin_corners[pins] - self.ball_size + bigboxlen / 2
+        logind = np.all(abs(ball_corners[balls] - bigboxcenters) < bigboxlen / 2, axis=1)
+        if not np.any(logind):
+            return
+        # only the pairs that touch go further
+        balls, pins = balls[logind], pins[logind]
+        center_vectors = ball_corners[balls] + self.ball_size / 2 - (pin_corners[pins] + pin_size / 2)
+        scales = (self.vx[balls] * center_vectors[:, 0] + self.vy[balls] * center_vectors[:, 1]) / np.sum(
+            center_vectors ** 2, axis=1)
+        scales = scales * (scales < 0)
+        # mean over the pins each ball touches, pairs come in ball order so the sums add up as Ball's do
+        touching = np.bincount(balls, minlength=len(self))
+        touched = touching > 0
+        for v, component in ((self.vx, center_vectors[:, 0]), (self.vy, center_vectors[:, 1])):
+            v[touched] += -(np.bincount(balls, 1.5 * component * scales, len(self))[touched] / touching[touched])
+
+    def sweep_pins(self, timestep, pin_corners, pin_size, pin_grid, maxContacts=8):
+        # Moves every ball through the step with the pins swept along its path, so how far a ball gets into a pin
+        # no longer depends on the step length. The contact is the one check_collisions tests, the ball's square
+        # overlapping the pin's, found as the ball corner entering the pin grown by ball_size on its top left. A
+        # ball that reaches a pin stops there, takes check_collisions' response with its velocity at that moment,
+        # and the rest of its step is swept again from there, up to maxContacts times; a ball still hitting pins
+        # after that finishes its step without them, as a ball wedged between pins would otherwise never move. A
+        # ball starting the step overlapping a pin and moving towards it is a contact at once, which is how balls
+        # resting on a pin keep bouncing off it. Off by default: balls no longer sink into pins, so they also no
+        # longer squeeze through gaps narrower than a ball, and payouts differ from the game's at any step length
+        # (benchmarks.py swept).
+        x, y, vx, vy = self.x, self.y, self.vx, self.vy
+        remaining = np.full(len(self), float(timestep))
+        self.x, self.y, self.vx, self.vy = self.motion(x, y, vx, vy, timestep)
+        active = np.arange(len(self))
+        for contact in range(maxContacts):
+            if not len(active) or not len(pin_corners):
+                return
+            balls, pins = pin_grid.query_segments(x, y, self.x[active], self.y[active])
+            times = sweep_boxes(x[balls], y[balls], self.x[active][balls], self.y[active][balls],
+                                pin_corners[pins] - self.ball_size, pin_size + self.ball_size)
+            hit = np.isfinite(times)
+            balls, pins, times = balls[hit], pins[hit], times[hit]
+            # the ball's velocity at each contact, a pin it starts on only counts if the ball moves towards it
+            t = times * remaining[balls]
+            cx, cy = x[balls] + times * (self.x[active][balls] - x[balls]), y[balls] + times * (
+                self.y[active][balls] - y[balls])
+            cvx, cvy = self.motion(x[balls], y[balls], vx[balls], vy[balls], t)[2:]
+            center_vectors = np.stack([cx, cy], axis=1) + self.ball_size / 2 - (pin_corners[pins] + pin_size / 2)
+            scales = (cvx * center_vectors[:, 0] + cvy * center_vectors[:, 1]) / np.sum(center_vectors ** 2, axis=1)
+            contacts = (times > 0) | (scales < 0)
+            if not np.any(contacts):
+                return
+            balls, pins, times, scales = balls[contacts], pins[contacts], times[contacts], scales[contacts]
+            # the earliest pin of each ball
+            order = np.lexsort((times, balls))
+            balls, first = np.unique(balls[order], return_index=True)
+            pick = np.flatnonzero(contacts)[order][first]
+            scales = np.minimum(scales[order][first], 0)[:, None]
+            center_vectors, times = center_vectors[pick], times[order][first]
+            # the response of check_collisions at the contact
+            x, y = cx[pick], cy[pick]
+            vx, vy = (np.stack([cvx[pick], cvy[pick]], axis=1) - 1.5 * center_vectors * scales).T
+            remaining = remaining[balls] * (1 - times)
+            active = active[balls]
+            self.x[active], self.y[active], self.vx[active], self.vy[active] = self.motion(x, y, vx, vy, remaining)
+
+    def collide_balls(self):
+        # Elastic collisions between equal balls. close_pairs finds the balls whose squares overlap through its
+        # grid, of those the ones whose centers are within a ball_size and moving towards each other swap their
+        # velocity components along the line between them. A ball hitting several at once takes the sum.
+        first, second = close_pairs(np.stack([self.x, self.y], axis=1), self.ball_size)
+        if not len(first):
+            return
+        dx, dy = self.x[second] - self.x[first], self.y[second] - self.y[first]
+        distances = np.sqrt(dx ** 2 + dy ** 2)
+        closing = ((self.vx[first] - self.vx[second]) * dx + (self.vy[first] - self.vy[second]) * dy) / np.maximum(
+            distances, 1e-12)
+        hits = (distances < self.ball_size) & (distances > 0) & (closing > 0)
+        if not np.any(hits):
+            return
+        first, second = first[hits], second[hits]
+        # the exchanged velocity along the unit vector from first to second
+        exchange = closing[hits] / distances[hits]
+        for v, d in ((self.vx, dx[hits]), (self.vy, dy[hits])):
+            v -= np.bincount(first, exchange * d, len(self))
+            v += np.bincount(second, exchange * d, len(self))
+
+
+class PinGrid:
+    # Uniform grid over the pins for collision queries. Cells are as wide as the box a ball corner has to be in to
+    # touch a pin, pin_size + ball_size, and pins are hashed by the center of that box, so every pin a ball can touch
+    # is in the ball corner's cell or one next to it. Pins are sorted by column and then row, so the three cells
+    # of one column of the 3x3 neighbourhood are one contiguous run.
+    def __init__(self, pin_corners, pin_size, ball_size):
+        self.cellsize = pin_size + ball_size
+        centers = pin_corners - ball_size + self.cellsize / 2
+        self.origin = np.min(centers, axis=0) if len(centers) else np.zeros(2)
+        cells = np.floor((centers - self.origin) / self.cellsize).astype(int)
+        self.columns, self.rows = np.max(cells, axis=0) + 1 if len(cells) else (0, 0)
+        cellids = cells[:, 0] * self.rows + cells[:, 1]
+        self.order = np.argsort(cellids, kind='stable')
+        # starts[c] is the first sorted pin in cell c, with one past the last cell at the end
+        self.starts = np.searchsorted(cellids[self.order], np.arange(self.columns * self.rows + 1))
+        self.neighbourhoods = {}
+        self.table = self.tableStarts = None
+
+    def neighbourhood(self, column, row):
+        # indices of the pins in a cell and the eight around it, in pin_corners order. Each is gathered the first
+        # time it is asked for and kept
+        if (column, row) not in self.neighbourhoods:
+            top, bottom = min(max(row - 1, 0), self.rows), min(max(row + 2, 0), self.rows)
+            runs = [self.order[self.starts[c * self.rows + top]:self.starts[c * self.rows + bottom]]
+                    for c in range(max(column - 1, 0), min(column + 2, self.columns))]
+            self.neighbourhoods[column, row] = np.sort(np.concatenate(runs)) if runs else np.zeros(0, dtype=int)
+        return self.neighbourhoods[column, row]
+
+    def query(self, x, y):
+        # pins near a ball corner at x, y
+        return self.neighbourhood(math.floor((x - self.origin[0]) / self.cellsize),
+                                  math.floor((y - self.origin[1]) / self.cellsize))
+
+    def query_segments(self, x0, y0, x1, y1):
+        # pins near any point of the segments from ball corners x0, y0 to x1, y1, as (ball, pin) pairs. Every cell
+        # the segment's bounding box reaches and one around it is taken, each column of those is one run of the
+        # sorted pins.
+        low = lambda a, b, origin, cells: np.clip(np.floor((np.minimum(a, b) - origin) / self.cellsize) - 1, 0,
+                                                   cells).astype(int)
+        high = lambda a, b, origin, cells: np.clip(np.floor((np.maximum(a, b) - origin) / self.cellsize) + 2, 0,
+                                                    cells).astype(int)
+        left, right = low(x0, x1, self.origin[0], self.columns), high(x0, x1, self.origin[0], self.columns)
+        top, bottom = low(y0, y1, self.origin[1], self.rows), high(y0, y1, self.origin[1], self.rows)
+        # one entry per ball and column
+        widths = np.maximum(right - left, 0)
+        balls = np.repeat(np.arange(len(x0)), widths)
+        columns = np.repeat(left, widths) + np.arange(len(balls)) - np.repeat(np.cumsum(widths) - widths, widths)
+        starts = self.starts[columns * self.rows + top[balls]]
+        counts = np.maximum(self.starts[columns * self.rows + bottom[balls]] - starts, 0)
+        pairs = np.repeat(np.arange(len(balls)), counts)
+        offsets = np.arange(len(pairs)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return balls[pairs], self.order[np.repeat(starts, counts) + offsets]
+
+    def query_many(self, x, y):
+        # query for arrays of ball corners at once. Returns the ball and pin index of every candidate pair, grouped
+        # by ball in order. The neighbourhoods are laid end to end in a table covering the grid and a border of one
+        # cell; a ball further out is looked up in the border cell nearest it, whose pins it is too far to touch
+        if self.table is None:
+            cells = [self.neighbourhood(column, row) for column in range(-1, self.columns + 1)
+                     for row in range(-1, self.rows + 1)]
+            self.table = np.concatenate(cells + [np.zeros(0, dtype=int)])
+            self.tableStarts = np.cumsum([0] + [len(cell) for cell in cells])
+        columns = np.clip(np.floor((x - self.origin[0]) / self.cellsize).astype(int), -1, self.columns)
+        rows = np.clip(np.floor((y - self.origin[1]) / self.cellsize).astype(int), -1, self.rows)
+        cells = (columns + 1) * (self.rows + 2) + rows + 1
+        counts = self.tableStarts[cells + 1] - self.tableStarts[cells]
+        balls = np.repeat(np.arange(len(cells)), counts)
+        # position of each pair within its ball's run
+        offsets = np.arange(len(balls)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return balls, self.table[np.repeat(self.tableStarts[cells], counts) + offsets]
+
+
+def sweep_boxes(x0, y0, x1, y1, corners, size):
+    # Fraction of the way from (x0, y0) to (x1, y1) at which a point moving along it is first inside the open
+    # square of side size at corners, 0 if it starts inside and inf if it never is. Every argument is an array over
+    # pairs. The point is inside while it is within the square's slab on both axes, so the answer is the later of
+    # the two entering times if that comes before both leaving times.
+    enters, leaves = [], []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start, end, low in ((x0, x1, corners[:, 0]), (y0, y1, corners[:, 1])):
+            d = end - start
+            first, second = (low - start) / d, (low + size - start) / d
+            # not moving on an axis, the slab is all or nothing
+            inside = (start > low) & (start < low + size)
+            enters.append(np.where(d == 0, np.where(inside, -np.inf, np.inf), np.minimum(first, second)))
+            leaves.append(np.where(d == 0, np.where(inside, np.inf, -np.inf), np.maximum(first, second)))
+    enter, leave = np.maximum(*enters), np.minimum(*leaves)
+    return np.where((enter < leave) & (enter < 1) & (leave > 0), np.maximum(enter, 0), np.inf)
+
+
+def close_pairs(points, distance):
+    # Every pair of points closer than distance in both x and y, as index arrays i < j. The points are hashed
+    # into cells distance wide, so a close pair is in the same cell or neighbouring ones; each point is matched
+    # with its own cell and four of its neighbours so every pair of cells is looked at once.
+    if not len(points):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    cells = np.floor((points - np.min(points, axis=0)) / distance).astype(int)
+    rows = np.max(cells[:, 1]) + 3
+    # cell ids with a border row above and below so neighbours never wrap into the next column
+    cellids = (cells[:, 0] + 1) * rows + cells[:, 1] + 1
+    order = np.argsort(cellids, kind='stable')
+    starts = np.searchsorted(cellids[order], np.arange((np.max(cells[:, 0]) + 3) * rows + 1))
+    first, second = [], []
+    for offset in (0, rows - 1, rows, rows + 1, 1):
+        neighbours = cellids + offset
+        counts = starts[neighbours + 1] - starts[neighbours]
+        i = np.repeat(np.arange(len(points)), counts)
+        offsets = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(starts[neighbours], counts) + offsets]
+        keep = np.all(abs(points[i] - points[j]) < distance, axis=1) & ((i < j) if offset == 0 else (i != j))
+        first.append(np.minimum(i[keep], j[keep]))
+        second.append(np.maximum(i[keep], j[keep]))
+    return np.concatenate(first), np.concatenate(second)
+
+
+def random_pins(pin_size, numPins=200, rng=r):
+    # Pin corners scattered over the board, denser towards the bottom, with any pin overlapping one drawn before it
+    # removed, so no two pins are closer than pin_size in both directions. Dropping the pins in the order they were
+    # drawn is worked out for all of them at once: each round keeps every undecided pin none of whose overlapping
+    # earlier pins are still undecided, and removes the undecided ones overlapping a kept pin, which ends with what
+    # placing them one at a time would keep. The draws are in random order, so it takes only a few rounds.
+    xcoords = np.array([rng.random() * 0.78 - 0.78 / 2 for i in range(numPins)])
+    ycoords = np.array([rng.random() * 0.91 + 0.05 for i in range(numPins)])
+    xcoords = xcoords * ycoords ** 0.33 + 0.1 + 0.78 / 2
+    corners = np.transpose([xcoords, ycoords])
+    # earlier, later index pairs of overlapping pins
+    earlier, later = close_pairs(corners, pin_size)
+    # 0 undecided, 1 kept, -1 removed. Pins in no pair stay undecided and are kept, each round only touches the
+    # pairs still undecided
+    state = np.zeros(len(corners), dtype=int)
+    blocked = np.zeros(len(corners), dtype=bool)
+    while len(earlier):
+        waiting = later[state[earlier] == 0]
+        pending = np.concatenate([earlier, later])
+        pending = pending[state[pending] == 0]
+        blocked[waiting] = True
+        state[pending[~blocked[pending]]] = 1
+        blocked[waiting] = False
+        state[later[(state[earlier] == 1) & (state[later] == 0)]] = -1
+        undecided = (state[earlier] == 0) | (state[later] == 0)
+        earlier, later = earlier[undecided], later[undecided]
+    return corners[state >= 0]
+
+
+class SessionLog:
+    # Binary record of a game, enough to play it again without a window. A header
+    #   magic b'PCHK', version, Physics value, ball collisions, seed, acceleration, physics timestep (ms)
+    # is followed by events, each a kind byte and its fields, all little endian:
+    #   b'B' new board: step, pin count, the pin corners as float64 x, y pairs
+    #   b'D' drop:      step, x dropped from, the sideways velocity it was given
+    #   b'E' end:       step, counter
+    # Steps count the fixed physics steps run before the event. Every event is flushed as it is written, so a
+    # session cut short keeps everything up to then.
+    header = struct.Struct('<4sBB?Qdd')
+    boardEvent = struct.Struct('<QI')
+    dropEvent = struct.Struct('<Qdd')
+    endEvent = struct.Struct('<Qq')
+    version = 1
+
+    def __init__(self, path, seed, accel, physics, ball_collisions, timestep):
+        self.file = open(path, 'wb')
+        self.write(self.header.pack(b'PCHK', self.version, physics.value, ball_collisions, seed, accel, timestep))
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def log_board(self, step, pin_corners):
+        self.write(b'B' + self.boardEvent.pack(step, len(pin_corners)) + np.asarray(pin_corners, '<f8').tobytes())
+
+    def log_drop(self, step, position, vx):
+        self.write(b'D' + self.dropEvent.pack(step, position, vx))
+
+    def close(self, step, counter):
+        self.write(b'E' + self.endEvent.pack(step, counter))
+        self.file.close()
+
+
+def read_session(path):
+    # Returns the header fields and the events of a SessionLog as (kind, step, fields) in order
+    with open(path, 'rb') as log_file:
+        data = log_file.read()
+    magic, version, physics, ball_collisions, seed, accel, timestep = SessionLog.header.unpack_from(data)
+    if magic != b'PCHK' or version != SessionLog.version:
+        raise ValueError('not a version {} Pachinko session: {}'.format(SessionLog.version, path))
+    session = {'seed': seed, 'accel': accel, 'physics': Physics(physics), 'ball_collisions': ball_collisions,
+               'timestep': timestep, 'events': []}
+    offset = SessionLog.header.size
+    while offset < len(data):
+        kind, offset = data[offset:offset + 1], offset + 1
+        if kind == b'B':
+            step, numPins = SessionLog.boardEvent.unpack_from(data, offset)
+            offset += SessionLog.boardEvent.size
+            pin_corners = np.frombuffer(data, '<f8', numPins * 2, offset).reshape(numPins, 2)
+            offset += pin_corners.nbytes
+            session['events'].append(('board', step, pin_corners))
+        elif kind == b'D':
+            step, position, vx = SessionLog.dropEvent.unpack_from(data, offset)
+            offset += SessionLog.dropEvent.size
+            session['events'].append(('drop', step, (position, vx)))
+        elif kind == b'E':
+            step, counter = SessionLog.endEvent.unpack_from(data, offset)
+            offset += SessionLog.endEvent.size
+            session['events'].append(('end', step, counter))
+        else:
+            raise ValueError('unknown event {!r} at byte {} of {}'.format(kind, offset - 1, path))
+    return session
+
+
+class BoardCanvas:
+    # Draws the board, pins, balls and payouts as items on one canvas filling the window. Positions are given in
+    # the same fractions of the window the widgets were placed with. Ball and payout items are pooled: ball item i
+    # always shows ball i of the BallSystem, spare ones are hidden, and every frame's moves are sent to Tcl as
+    # one script rather than one call per ball.
+    payout_time = 1.0
+
+    def __init__(self, root, ball_size):
+        self.canvas = tk.Canvas(master=root, bg=root.cget('bg'), highlightthickness=0)
+        self.canvas.place(relx=0, rely=0, relwidth=1, relheight=1)
+        self.ball_size = ball_size
+        self.width, self.height = 800, 800
+        self.balls = []
+        self.shown = 0
+        self.labels = []
+        self.labelExpiry = []
+        borderwidth = 0.02
+        self.rectangle(0.1 - borderwidth, 0, borderwidth, 1, 'black')
+        self.rectangle(0.9, 0, borderwidth, 1, 'black')
+        self.rectangle(0.1, 0, 0.8, 1, 'blue')
+        self.canvas.bind('<Configure>', self.resize)
+
+    def rectangle(self, x, y, width, height, color, tags=()):
+        return self.canvas.create_rectangle(x * self.width, y * self.height, (x + width) * self.width,
+                                            (y + height) * self.height, fill=color, outline='', tags=tags)
+
+    def resize(self, event):
+        # every item is stretched to the new size, balls and labels are placed again next frame anyway
+        if event.width > 1 and event.height > 1:
+            self.canvas.scale('all', 0, 0, event.width / self.width, event.height / self.height)
+            self.width, self.height = event.width, event.height
+
+    def draw_pins(self, pin_corners, pin_size):
+        self.canvas.delete('pin')
+        for x, y in pin_corners:
+            self.rectangle(x, y, pin_size, pin_size, 'red', 'pin')
+
+    def draw_balls(self, x, y):
+        while len(self.balls) < len(x):
+            self.balls.append(self.rectangle(0, 0, self.ball_size, self.ball_size, 'orange', 'ball'))
+        path = str(self.canvas)
+        left, top = x * self.width, y * self.height
+        right, bottom = left + self.ball_size * self.width, top + self.ball_size * self.height
+        script = ['{} coords {} {:.1f} {:.1f} {:.1f} {:.1f}'.format(path, item, *corners)
+                  for item, corners in zip(self.balls, zip(left, top, right, bottom))]
+        # items past the live balls were shown last frame and are hidden, ones coming back into use shown
+        script.extend('{} itemconfigure {} -state hidden'.format(path, item) for item in self.balls[len(x):self.shown])
+        script.extend('{} itemconfigure {} -state normal'.format(path, item) for item in self.balls[self.shown:len(x)])
+        self.shown = len(x)
+        if script:
+            self.canvas.tk.eval('\n'.join(script))
+
+    def show_payouts(self, payouts, positions, now):
+        # each payout takes a hidden label, or a new one when all are showing
+        for payout, position in zip(payouts, positions):
+            if None in self.labelExpiry:
+                i = self.labelExpiry.index(None)
+            else:
+                self.labels.append(self.canvas.create_text(0, 0, fill='white', font=('', 12, 'bold'), tags='payout'))
+                self.labelExpiry.append(None)
+                i = len(self.labels) - 1
+            self.canvas.coords(self.labels[i], position * self.width, (1 - 0.02) * self.height)
+            self.canvas.itemconfigure(self.labels[i], text=str(payout), state='normal')
+            self.labelExpiry[i] = now + self.payout_time
+
+    def hide_payouts(self, now):
+        for i, expiry in enumerate(self.labelExpiry):
+            if expiry is not None and expiry <= now:
+                self.canvas.itemconfigure(self.labels[i], state='hidden')
+                self.labelExpiry[i] = None
+
+
 class Dropper:
     def __init__(self, root):
         self.widget = tk.Label(master=root, text='V', fg='orange', bg='blue', font=('', 20, 'bold'))
@@ -93,65 +563,57 @@ class Dropper:
 class Pachinko:
     pin_size = 0.008
 
-    def __init__(self, framerate=60, acceleration=5e-7, physics=Physics.FREEFALL):
+    def __init__(self, framerate=60, acceleration=5e-7, physics=Physics.FREEFALL, substeps=4, max_steps=None,
+                 numPins=200, seed=None, record=None):
+        # Physics runs in fixed steps of framelength / substeps, as many as the time since the last frame on the
+        # monotonic clock covers, leftover time carries over to the next frame. After a stall at most max_steps
+        # (two frames' worth by default) are run at once and the rest of the time is dropped.
         self.framelength = round(1000 / framerate)
-        self.allBalls = []
+        self.numPins = numPins
+        self.timestep = self.framelength / substeps
+        self.max_steps = 2 * substeps if max_steps is None else max_steps
+        self.accumulator = 0.0
+        # frames that started more than half a frame late, and frames whose catch up hit max_steps
+        self.lateFrames = 0
+        self.droppedFrames = 0
+        self.balls = BallSystem(acceleration, physics)
+        # boards and the drops' sideways jitter come from one generator, a session is repeated by its seed
+        self.seed = r.SystemRandom().randrange(2 ** 63) if seed is None else seed
+        self.random = r.Random(self.seed)
+        self.steps = 0
+        self.credits = 100
+        self.log = None
+        if record is not None:
+            self.log = SessionLog(record, self.seed, acceleration, physics, self.balls.ball_collisions, self.timestep)
         self.root = tk.Tk()
         self.root.title('Pachinko')
-        self.pins = []
+        self.board = BoardCanvas(self.root, Ball.ball_size)
         self.physics = physics
-        self.counter = tk.Label(master=self.root, text=str(100), foreground="#BA2121",
+        self.counter = tk.Label(master=self.root, text=str(self.credits), foreground="#BA2121",
                                 background="#F7F7F7", font=('Times New Roman', 20))
         self.counter.place(relx=0.92, rely=0, relwidth=0.08, relheight=0.05)
-        border1 = tk.Frame(master=self.root, bg='black')
-        border2 = tk.Frame(master=self.root, bg='black')
-        borderwidth = 0.02
-        border1.place(relx=0.1 - borderwidth, rely=0, relwidth=borderwidth, relheight=1)
-        border2.place(relx=0.9, rely=0, relwidth=borderwidth, relheight=1)
-        tk.Frame(master=self.root, bg='blue').place(relx=0.1, rely=0, relwidth=0.8, relheight=1)
         self.dropper = Dropper(self.root)
         self.root.geometry('800x800')
         self.accel = acceleration
         self.root.bind('<ButtonRelease-1>', self.handle_click)
         self.root.bind('<FocusIn>', Pachinko.square_window)
         self.root.bind('n', self.new_board)
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
         self.new_board()
+        self.lastFrame = self.nextFrame = time.monotonic()
         self.update_loop()
         self.root.mainloop()
 
     def new_board(self, event=None):
-        for pin in self.pins:
-            pin.destroy()
-        xcoords = np.array([r.random() * 0.78 - 0.78 / 2 for i in range(200)])
-        ycoords = np.array([r.random() * 0.91 + 0.05 for i in range(200)])
-        xcoords = xcoords * ycoords ** 0.33 + 0.1 + 0.78 / 2
-        ydiffs = (np.diff(np.sort(ycoords)))
-        yloc = ydiffs < self.pin_size
-        argind = np.argsort(ycoords)
-        orderedx = xcoords[argind]
-        xdiffs = np.diff(orderedx)
-        xloc = [False] * len(orderedx)
-        accruedDistances = np.array([0.0] * len(orderedx))
-        for i in range(len(xloc) - 1):
-            subsetLocs = np.copy(yloc[:i + 1])
-            ind = np.array(subsetLocs).tostring().rfind(b'\x00')
-            if ind == -1: ind = 0
-            subsetLocs[:ind] = [False] * ind
-            accruedDistances[:i + 1] = accruedDistances[:i + 1] - xdiffs[i]
-            if np.any(abs(accruedDistances[:i + 1][subsetLocs]) < self.pin_size):
-                xloc[i + 1] = True
-        yloc = np.insert(yloc, 0, False)
-        # xloc = np.insert(abs(np.diff(xloc)<self.pin_size), 0, False)
-        ycoords = ycoords[argind][~(yloc & xloc)]
-        xcoords = xcoords[argind][~(xloc & yloc)]
-        self.pin_corners = np.transpose(np.concatenate(([xcoords], [ycoords])))
-        for i in range(len(ycoords)):
-            self.pins.append(tk.Frame(master=self.root, bg='red'))
-            self.pins[-1].place(relx=xcoords[i], rely=ycoords[i],
-                                relwidth=self.pin_size, relheight=self.pin_size)
+        self.pin_corners = random_pins(self.pin_size, self.numPins, self.random)
+        if self.log is not None:
+            self.log.log_board(self.steps, self.pin_corners)
+        self.pin_grid = PinGrid(self.pin_corners, self.pin_size, Ball.ball_size)
+        self.board.draw_pins(self.pin_corners, self.pin_size)
 
     def handle_click(self, event):
-        self.counter['text'] = str(int(int(self.counter['text']) - 100))
+        self.credits -= 100
+        self.counter['text'] = str(self.credits)
         relxClick = self.dropper.get_pos() + 0.05
         # windowWidth=event.widget.winfo_toplevel().winfo_width()
         # windowHeight=event.widget.winfo_toplevel().winfo_height()
@@ -159,26 +621,53 @@ class Pachinko:
         # if event.widget is not self.root:
         #    pos += event.widget.winfo_x()
         # relxClick=pos/windowWidth
-        self.allBalls.append(Ball(relxClick, self.accel, self.root, self.physics))
+        vx = self.random.normalvariate(0, 0.00001)
+        self.balls.add(relxClick, [vx])
+        if self.log is not None:
+            self.log.log_drop(self.steps, relxClick, vx)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close(self.steps, self.credits)
+        self.root.destroy()
 
     @staticmethod
     def square_window(event):
         event.widget.geometry('800x800')
 
     def update_loop(self):
-        self.dropper.update(self.framelength)
-        for ball in self.allBalls:
-            payout = ball.step_forward(self.framelength)
-            if payout:
-                lbl = tk.Label(master=self.root, text=str(payout[0]))
-                lbl.place(relx=payout[1] - 0.02, rely=1 - 0.04, relheight=0.04, relwidth=0.04)
-                lbl.after(1000, lbl.destroy)
-                # Signal received from ball that it is out of frame and the widget has
-                # been destroyed, now must remove the ball object from the game.
-                self.allBalls.remove(ball)
-                self.counter['text'] = str(int(int(self.counter['text']) + payout[0]))
-            ball.check_collisions(self.pin_corners, self.pin_size)
-        self.root.after(self.framelength, self.update_loop)
-
-
-game = Pachinko(acceleration=6e-7, physics=Physics.FRICTION)
+        now = time.monotonic()
+        if now - self.nextFrame > self.framelength / 2000:
+            self.lateFrames += 1
+        self.accumulator += (now - self.lastFrame) * 1000
+        self.lastFrame = now
+        numSteps = int(self.accumulator // self.timestep)
+        if numSteps > self.max_steps:
+            self.droppedFrames += 1
+            numSteps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= numSteps * self.timestep
+        self.dropper.update(numSteps * self.timestep)
+        payouts, positions = self.balls.advance(self.timestep, numSteps, self.pin_corners, self.pin_size,
+                                                self.pin_grid)
+        self.steps += numSteps
+        if len(payouts):
+            self.board.show_payouts(payouts, positions, now)
+            self.credits += int(np.sum(payouts))
+            self.counter['text'] = str(self.credits)
+        self.board.draw_balls(self.balls.x, self.balls.y)
+        self.board.hide_payouts(now)
+        if self.lateFrames or self.droppedFrames:
+            title = 'Pachinko  late frames {}  dropped {}'.format(self.lateFrames, self.droppedFrames)
+            if self.root.title() != title:
+                self.root.title(title)
+        # the next frame is due a framelength after this one was, rather than after this one finished, unless
+        # the loop has fallen behind and starts over from now
+        self.nextFrame = max(self.nextFrame + self.framelength / 1000, time.monotonic())
+        self.root.after(round((self.nextFrame - time.monotonic()) * 1000), self.update_loop)
+
+
+if __name__ == '__main__':
+    # python Pachinko.py [session file], with a file name the game is recorded to it for pachinko_replay.py
+    game = Pachinko(acceleration=6e-7, physics=Physics.FRICTION, record=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,269 @@
+import random
+import sys
+import tkinter as tk
+import time
+import numpy as np
+from pachinko_montecarlo import simulate
+from Pachinko import close_pairs, random_pins, Ball, BallSystem, BoardCanvas, Pachinko, Physics, PinGrid
+
+
+def time_call(func, *args, repeats=3):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class BallState:
+    # Stands in for Ball without a window, the physics and check_collisions only need the position and velocity
+    ball_size = Ball.ball_size
+    mu = Ball.mu
+
+    def __init__(self, x, y, vx, vy, accel=6e-7):
+        self.x, self.y, self.vx, self.vy = x, y, vx, vy
+        self.accel = accel
+
+
+def scattered_pins(numPins, seed=0):
+    # The funnel shaped spread of random_pins without removing overlaps, which leaves fewer pins the more are asked
+    # for, so the pin count can be swept
+    rng = np.random.default_rng(seed)
+    ycoords = rng.random(numPins) * 0.91 + 0.05
+    xcoords = (rng.random(numPins) * 0.78 - 0.78 / 2) * ycoords ** 0.33 + 0.1 + 0.78 / 2
+    return np.transpose([xcoords, ycoords])
+
+
+def random_balls(numBalls, pin_corners, seed=0):
+    # Half the balls are placed touching a pin so the collision response is exercised, the rest anywhere on the board
+    rng = np.random.default_rng(seed)
+    balls = []
+    for i in range(numBalls):
+        if i % 2:
+            x, y = pin_corners[rng.integers(len(pin_corners))] + rng.uniform(-Ball.ball_size, Pachinko.pin_size, 2)
+        else:
+            x, y = rng.uniform(0.1, 0.9), rng.uniform(0, 1)
+        balls.append(BallState(x, y, rng.normal(0, 1e-4), rng.uniform(0, 1e-3)))
+    return balls
+
+
+def check_all(balls, velocities, pin_corners, pin_grid=None):
+    # the response changes the velocities, every call starts the balls from the same ones
+    for ball, (vx, vy) in zip(balls, velocities):
+        ball.vx, ball.vy = vx, vy
+        Ball.check_collisions(ball, pin_corners, Pachinko.pin_size, pin_grid)
+    return np.array([[ball.vx, ball.vy] for ball in balls])
+
+
+def bench_pin_grid(pinCounts=(200, 1000, 5000, 20000), ballCounts=(10, 100, 1000)):
+    # One frame of collision checks, every ball against every pin as before against the grid query
+    print('{:>6} {:>6} {:>12} {:>12} {:>12} {:>10}'.format('pins', 'balls', 'build (ms)', 'all (ms)', 'grid (ms)',
+                                                           'identical'))
+    for numPins in pinCounts:
+        pin_corners = scattered_pins(numPins)
+        buildTime, pin_grid = time_call(PinGrid, pin_corners, Pachinko.pin_size, Ball.ball_size)
+        for numBalls in ballCounts:
+            balls = random_balls(numBalls, pin_corners)
+            velocities = [(ball.vx, ball.vy) for ball in balls]
+            allTime, allV = time_call(check_all, balls, velocities, pin_corners)
+            gridTime, gridV = time_call(check_all, balls, velocities, pin_corners, pin_grid)
+            print('{:>6} {:>6} {:>12.3f} {:>12.3f} {:>12.3f} {:>10}'.format(
+                len(pin_corners), numBalls, buildTime * 1000, allTime * 1000, gridTime * 1000,
+                str(np.array_equal(allV, gridV))))
+
+
+def step_balls_loop(balls, timestep, physics, pin_corners, pin_grid):
+    # The original Pachinko.update_loop without the widgets, kept as the reference for the benchmark
+    payouts = []
+    for ball in list(balls):
+        physics(ball, timestep)
+        if ball.y > 1:
+            payouts.append(round((ball.x - 0.5) ** 4 * 40000))
+            balls.remove(ball)
+            continue
+        if abs(ball.x - 0.5 + ball.ball_size / 2) > 0.40 - ball.ball_size / 2:
+            ball.vx *= - np.sign(ball.vx) * np.sign(ball.x - 0.5 + ball.ball_size / 2)
+        Ball.check_collisions(ball, pin_corners, Pachinko.pin_size, pin_grid)
+    return payouts
+
+
+def bench_ball_system(ballCounts=(10, 100, 1000, 5000), numFrames=50, framelength=17, numPins=200, old_limit=1000):
+    # Frames of every ball stepped, bounced and checked against the pins, one Ball at a time against the
+    # BallSystem arrays
+    pin_corners = scattered_pins(numPins)
+    pin_grid = PinGrid(pin_corners, Pachinko.pin_size, Ball.ball_size)
+    print('{:>9} {:>6} {:>14} {:>14} {:>12} {:>8}'.format('physics', 'balls', 'loop (ms/f)', 'system (ms/f)',
+                                                          'max abs err', 'payouts'))
+    for physics in Physics:
+        for numBalls in ballCounts:
+            rng = np.random.default_rng(1)
+            start = np.transpose([rng.uniform(0.12, 0.87, numBalls), rng.uniform(0, 1, numBalls),
+                                  rng.normal(0, 1e-5, numBalls), rng.uniform(0, 1e-3, numBalls)])
+            system = BallSystem(6e-7, physics)
+            system.x, system.y, system.vx, system.vy = np.copy(start.T)
+            systemPayouts = []
+            begin = time.perf_counter()
+            for _ in range(numFrames):
+                systemPayouts.extend(system.step_forward(framelength)[1])
+                system.check_collisions(pin_corners, Pachinko.pin_size, pin_grid)
+            systemTime = (time.perf_counter() - begin) / numFrames
+            if numBalls > old_limit:
+                print('{:>9} {:>6} {:>14} {:>14.3f} {:>12} {:>8}'.format(physics.name, numBalls, '-',
+                                                                       systemTime * 1000, '-', len(systemPayouts)))
+                continue
+            balls = [BallState(*state) for state in start]
+            update = {Physics.FREEFALL: Ball.update_freefall, Physics.FRICTION: Ball.update_friction}[physics]
+            loopPayouts = []
+            begin = time.perf_counter()
+            for _ in range(numFrames):
+                loopPayouts.extend(step_balls_loop(balls, framelength, update, pin_corners, pin_grid))
+            loopTime = (time.perf_counter() - begin) / numFrames
+            err = np.max(np.abs(np.array([[ball.x, ball.y, ball.vx, ball.vy] for ball in balls]) -
+                                np.transpose([system.x, system.y, system.vx, system.vy])), initial=0)
+            print('{:>9} {:>6} {:>14.3f} {:>14.3f} {:>12.2e} {:>8}'.format(
+                physics.name, numBalls, loopTime * 1000, systemTime * 1000, err,
+                'same' if sorted(loopPayouts) == sorted(systemPayouts) else 'differ'))
+
+
+def bench_render(ballCounts=(10, 100, 500, 2000), numFrames=60):
+    # Drawing frames of moving balls, a placed tk.Frame per ball as before against the pooled canvas items. Needs
+    # a display; each frame is flushed with update_idletasks so the drawing is included.
+    root = tk.Tk()
+    root.geometry('800x800')
+    board = BoardCanvas(root, Ball.ball_size)
+    board.draw_pins(scattered_pins(200), Pachinko.pin_size)
+    root.update()
+    rng = np.random.default_rng(2)
+    print('{:>6} {:>14} {:>14}'.format('balls', 'frames (ms/f)', 'canvas (ms/f)'))
+    for numBalls in ballCounts:
+        x, y = rng.uniform(0.1, 0.9, numBalls), rng.uniform(0, 1, numBalls)
+        widgets = [tk.Frame(master=root, bg='orange') for _ in range(numBalls)]
+        begin = time.perf_counter()
+        for frame in range(numFrames):
+            for widget, ballx, bally in zip(widgets, x, y + frame * 1e-3):
+                widget.place(relx=ballx, rely=bally, relheight=Ball.ball_size, relwidth=Ball.ball_size)
+            root.update_idletasks()
+        framesTime = (time.perf_counter() - begin) / numFrames
+        for widget in widgets:
+            widget.destroy()
+        begin = time.perf_counter()
+        for frame in range(numFrames):
+            board.draw_balls(x, y + frame * 1e-3)
+            root.update_idletasks()
+        canvasTime = (time.perf_counter() - begin) / numFrames
+        print('{:>6} {:>14.3f} {:>14.3f}'.format(numBalls, framesTime * 1000, canvasTime * 1000))
+    root.destroy()
+
+
+def random_pins_loop(pin_size, numPins=200):
+    # The original Pachinko.new_board layout, kept as the reference for the benchmark
+    xcoords = np.array([random.random() * 0.78 - 0.78 / 2 for i in range(numPins)])
+    ycoords = np.array([random.random() * 0.91 + 0.05 for i in range(numPins)])
+    xcoords = xcoords * ycoords ** 0.33 + 0.1 + 0.78 / 2
+    ydiffs = (np.diff(np.sort(ycoords)))
+    yloc = ydiffs < pin_size
+    argind = np.argsort(ycoords)
+    orderedx = xcoords[argind]
+    xdiffs = np.diff(orderedx)
+    xloc = [False] * len(orderedx)
+    accruedDistances = np.array([0.0] * len(orderedx))
+    for i in range(len(xloc) - 1):
+        subsetLocs = np.copy(yloc[:i + 1])
+        ind = np.array(subsetLocs).tobytes().rfind(b'\x00')
+        if ind == -1: ind = 0
+        subsetLocs[:ind] = [False] * ind
+        accruedDistances[:i + 1] = accruedDistances[:i + 1] - xdiffs[i]
+        if np.any(abs(accruedDistances[:i + 1][subsetLocs]) < pin_size):
+            xloc[i + 1] = True
+    yloc = np.insert(yloc, 0, False)
+    ycoords = ycoords[argind][~(yloc & xloc)]
+    xcoords = xcoords[argind][~(xloc & yloc)]
+    return np.transpose(np.concatenate(([xcoords], [ycoords])))
+
+
+def bench_layout(candidateCounts=(200, 1000, 5000, 20000, 100000), old_limit=5000):
+    # Boards from the same candidate pins, the original loop against the grid based generator, with the number of
+    # overlapping pin pairs each leaves
+    print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}'.format('candidates', 'old pins', 'overlaps', 'new pins',
+                                                                  'overlaps', 'old (ms)', 'new (ms)'))
+    for numPins in candidateCounts:
+        random.seed(numPins)
+        newTime, pins = time_call(random_pins, Pachinko.pin_size, numPins, repeats=1)
+        if numPins <= old_limit:
+            random.seed(numPins)
+            oldTime, oldPins = time_call(random_pins_loop, Pachinko.pin_size, numPins, repeats=1)
+            old = [len(oldPins), len(close_pairs(oldPins, Pachinko.pin_size)[0]), '{:.3f}'.format(oldTime * 1000)]
+        else:
+            old = ['-', '-', '-']
+        print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12.3f}'.format(
+            numPins, old[0], old[1], len(pins), len(close_pairs(pins, Pachinko.pin_size)[0]), old[2], newTime * 1000))
+
+
+def all_pairs(points, distance):
+    # Every pair tested against every other, the broadphase collide_balls would need without the grid
+    first, second = np.triu_indices(len(points), 1)
+    close = np.all(abs(points[first] - points[second]) < distance, axis=1)
+    return first[close], second[close]
+
+
+def bench_ball_collisions(ballCounts=(100, 1000, 3000, 10000), old_limit=3000):
+    # Finding the overlapping balls of one frame every pair at a time against close_pairs, and the whole
+    # collide_balls response, for balls spread over the board
+    rng = np.random.default_rng(4)
+    print('{:>6} {:>8} {:>12} {:>12} {:>12} {:>10}'.format('balls', 'pairs', 'all (ms)', 'grid (ms)',
+                                                          'frame (ms)', 'same'))
+    for numBalls in ballCounts:
+        system = BallSystem(6e-7, Physics.FRICTION)
+        system.x, system.y = rng.uniform(0.1, 0.89, numBalls), rng.uniform(0, 1, numBalls)
+        system.vx, system.vy = rng.normal(0, 1e-4, numBalls), rng.uniform(0, 1e-3, numBalls)
+        points = np.stack([system.x, system.y], axis=1)
+        gridTime, (first, second) = time_call(close_pairs, points, Ball.ball_size)
+        frameTime, _ = time_call(system.collide_balls)
+        if numBalls <= old_limit:
+            allTime, (allFirst, allSecond) = time_call(all_pairs, points, Ball.ball_size, repeats=1)
+            same = str(sorted(zip(first, second)) == sorted(zip(allFirst, allSecond)))
+            allTime = '{:.3f}'.format(allTime * 1000)
+        else:
+            allTime, same = '-', '-'
+        print('{:>6} {:>8} {:>12} {:>12.3f} {:>12.3f} {:>10}'.format(numBalls, len(first), allTime, gridTime * 1000,
+                                                                   frameTime * 1000, same))
+
+
+def bench_swept(timesteps=(17 / 4, 17, 34), numDrops=5000):
+    # The same drops at longer physics steps, with and without the swept pin test, against the game's model at its
+    # 4.25 ms step, for each physics, on the board pachinko_montecarlo.py uses by default. Payouts are compared as
+    # distributions, the distance is half the summed difference of the fractions in 16 bins. The noise row is the
+    # reference model again with other drops, distances near it are as close as numDrops can tell.
+    random.seed(0)
+    pin_corners = random_pins(Pachinko.pin_size, 200)
+    bins = np.linspace(0, 1025, 17)
+    drops = []
+    for seed in (5, 6):
+        rng = np.random.default_rng(seed)
+        drops.append((0.5 + 0.05 * np.sin(rng.uniform(0, 2 * np.pi, numDrops)), rng.normal(0, 0.00001, numDrops)))
+    print('{:>9} {:>9} {:>7} {:>10} {:>10} {:>10} {:>7}'.format('physics', 'step (ms)', 'swept', 'time (s)', 'mean',
+                                                               'distance', 'stuck'))
+    for physics in Physics:
+        reference = np.histogram(simulate(pin_corners, *drops[0], 6e-7, physics, 17 / 4), bins)[0] / numDrops
+        runs = [(drops[1], 17 / 4, False, 'noise')] + [(drops[0], timestep, swept, str(swept))
+                                                      for timestep in timesteps for swept in (False, True)]
+        for (topcoords, vx), timestep, swept, label in runs:
+            runTime, payouts = time_call(simulate, pin_corners, topcoords, vx, 6e-7, physics, timestep, 20000,
+                                         swept, repeats=1)
+            distance = np.sum(abs(np.histogram(payouts, bins)[0] / numDrops - reference)) / 2
+            print('{:>9} {:>9.2f} {:>7} {:>10.2f} {:>10.2f} {:>10.3f} {:>7}'.format(
+                physics.name.lower(), timestep, label, runTime, np.mean(np.maximum(payouts, 0)), distance,
+                np.sum(payouts < 0)))
+
+
+benchmarks = {'pingrid': bench_pin_grid, 'ballsystem': bench_ball_system, 'render': bench_render,
+              'layout': bench_layout, 'ballcollisions': bench_ball_collisions,
+              'swept': bench_swept}
+
+if __name__ == '__main__':
+    # python benchmarks.py [name ...], runs everything when no names are given
+    for name in sys.argv[1:] or benchmarks:
+        print(name)
+        benchmarks[name]()
+        print()
@@ -0,0 +1,89 @@
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Pachinko import random_pins, Ball, BallSystem, Pachinko, Physics, PinGrid
+
+# Headless payout statistics for a board. Balls are dropped from where the dropper would be, anywhere along its
+# swing, and run through the same BallSystem physics, pin response and payout as the game, a batch of balls at a
+# time. Batches are spread over a process pool, each with its own seed spawned from --seed, so a run is repeatable.
+# Run from this folder: python pachinko_montecarlo.py -n 1000000 -o payouts.npz
+
+
+def simulate(pin_corners, topcoords, vx, accel=6e-7, physics=Physics.FRICTION, timestep=17 / 4, maxTime=60000,
+             swept=False):
+    # Drops every ball at once and steps until all have left the bottom. Balls still on the board after maxTime ms
+    # are stuck and come back as -1 payouts. The drops stand for separate games, so the balls pass through each other.
+    system = BallSystem(accel, physics, ball_collisions=False, swept=swept)
+    system.add(topcoords, vx)
+    pin_grid = PinGrid(pin_corners, Pachinko.pin_size, Ball.ball_size)
+    payouts = []
+    elapsed = 0
+    while len(system) and elapsed < maxTime:
+        # the balls do not interact, so larger blocks of steps between checks cost nothing in accuracy
+        payouts.append(system.advance(timestep, 100, pin_corners, Pachinko.pin_size, pin_grid)[0])
+        elapsed += 100 * timestep
+    payouts.append(np.full(len(system), -1))
+    return np.concatenate(payouts)
+
+
+def simulate_batch(args):
+    # runs in a worker process, the seed sequence makes the drops of every batch independent and repeatable
+    pin_corners, numDrops, seed, accel, physics, timestep = args
+    rng = np.random.default_rng(seed)
+    # the dropper's position is 0.45 + 0.05 * sin of a phase sweeping evenly, a click drops from 0.05 to its right
+    topcoords = 0.5 + 0.05 * np.sin(rng.uniform(0, 2 * np.pi, numDrops))
+    vx = rng.normal(0, 0.00001, numDrops)
+    return simulate(pin_corners, topcoords, vx, accel, physics, timestep)
+
+
+def run_montecarlo(pin_corners, numDrops, seed=0, accel=6e-7, physics=Physics.FRICTION, timestep=17 / 4,
+                   batchSize=10000, workers=None):
+    start = time.perf_counter()
+    sizes = [min(batchSize, numDrops - i) for i in range(0, numDrops, batchSize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    batches = [(pin_corners, size, batchSeed, accel, physics, timestep) for size, batchSeed in zip(sizes, seeds)]
+    if workers == 1:
+        payouts = [simulate_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            payouts = list(pool.map(simulate_batch, batches))
+    return np.concatenate(payouts), time.perf_counter() - start
+
+
+def payout_statistics(payouts, cost=100):
+    # histogram counts[i] is the number of drops that paid i, stuck balls pay nothing
+    paid = np.maximum(payouts, 0)
+    return {'histogram': np.bincount(paid), 'mean': np.mean(paid), 'variance': np.var(paid),
+            'return to player': np.mean(paid) / cost, 'stuck': int(np.sum(payouts < 0))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drop many balls without a window and report payout statistics')
+    parser.add_argument('-n', '--drops', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0, help='seeds the drops of every batch')
+    parser.add_argument('--board-seed', type=int, default=0, help='seeds the pin layout as new_board makes it')
+    parser.add_argument('--pins', type=int, default=200, help='candidate pins drawn for the layout')
+    parser.add_argument('--physics', choices=[physics.name.lower() for physics in Physics], default='friction')
+    parser.add_argument('--acceleration', type=float, default=6e-7)
+    parser.add_argument('--timestep', type=float, default=17 / 4, help='physics step in ms')
+    parser.add_argument('-b', '--batch', type=int, default=10000, help='balls simulated together in a worker')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, default one per cpu')
+    parser.add_argument('-o', '--output', default=None, help='.npz file for the payouts and histogram')
+    args = parser.parse_args()
+    random.seed(args.board_seed)
+    pin_corners = random_pins(Pachinko.pin_size, args.pins)
+    payouts, elapsed = run_montecarlo(pin_corners, args.drops, args.seed, args.acceleration,
+                                      Physics[args.physics.upper()], args.timestep, args.batch, args.workers)
+    stats = payout_statistics(payouts)
+    print('{} drops on {} pins in {:.2f} s, {:.2f} s per million'.format(args.drops, len(pin_corners), elapsed,
+                                                                          elapsed / args.drops * 1e6))
+    print('mean payout {:.3f}, variance {:.1f}, return to player {:.2%}, {} stuck'.format(
+        stats['mean'], stats['variance'], stats['return to player'], stats['stuck']))
+    # the full histogram goes to the output, a coarse one is printed
+    counts, edges = np.histogram(np.maximum(payouts, 0), bins=16)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        print('{:>6.0f} - {:<6.0f} {:>10}'.format(low, high, count))
+    if args.output is not None:
+        np.savez_compressed(args.output, payouts=payouts, histogram=stats['histogram'], pin_corners=pin_corners)
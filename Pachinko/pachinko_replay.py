@@ -0,0 +1,53 @@
+import argparse
+import sys
+import time
+import numpy as np
+from Pachinko import read_session, Ball, BallSystem, Pachinko, PinGrid
+
+# Plays a session recorded with python Pachinko.py session.pchk again without a window, as fast as it runs, and
+# checks the counter it ends on against the one recorded. Drops carry their position and jitter and boards their
+# pins, so the replay steps the same balls through the same physics step for step.
+# Run from this folder: python pachinko_replay.py session.pchk
+
+
+def replay(session):
+    # Returns the counter at the end event (or after the last event of a session cut short), the counter recorded
+    # there or None, and the number of physics steps run
+    system = BallSystem(session['accel'], session['physics'], session['ball_collisions'])
+    pin_corners = np.zeros((0, 2))
+    pin_grid = None
+    credits = 100
+    steps = 0
+    recorded = None
+    for kind, step, fields in session['events']:
+        payouts = system.advance(session['timestep'], step - steps, pin_corners, Pachinko.pin_size, pin_grid)[0]
+        credits += int(np.sum(payouts))
+        steps = step
+        if kind == 'board':
+            pin_corners = fields
+            pin_grid = PinGrid(pin_corners, Pachinko.pin_size, Ball.ball_size)
+        elif kind == 'drop':
+            credits -= 100
+            system.add(fields[0], [fields[1]])
+        elif kind == 'end':
+            recorded = fields
+    return credits, recorded, steps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded Pachinko session and check its final counter')
+    parser.add_argument('session', help='file written by python Pachinko.py session.pchk')
+    args = parser.parse_args()
+    session = read_session(args.session)
+    start = time.perf_counter()
+    credits, recorded, steps = replay(session)
+    elapsed = time.perf_counter() - start
+    played = steps * session['timestep'] / 1000
+    drops = sum(kind == 'drop' for kind, step, fields in session['events'])
+    print('seed {}, {} drops, {:.1f} s of play replayed in {:.2f} s ({:.0f}x)'.format(
+        session['seed'], drops, played, elapsed, played / max(elapsed, 1e-9)))
+    if recorded is None:
+        print('counter {}, the session has no end record to check against'.format(credits))
+    else:
+        print('counter {}, recorded {}: {}'.format(credits, recorded, 'match' if credits == recorded else 'MISMATCH'))
+        sys.exit(credits != recorded)